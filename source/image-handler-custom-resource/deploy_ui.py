@@ -19,9 +19,13 @@ from __future__ import print_function
 
 import json
 import logging
+import mimetypes
 import os
 import ast
+import Queue
 import requests
+import shutil
+import threading
 import time
 import boto3
 from botocore.client import Config
@@ -34,7 +38,80 @@ if log_level not in ['DEBUG', 'INFO','WARNING', 'ERROR','CRITICAL']:
 log = logging.getLogger()
 log.setLevel(log_level)
 
-def DeployImageHandlerUI(deploy_config):
+content_types = {
+    '.htm': 'text/html',
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.png': 'image/png',
+    '.jpeg': 'image/jpeg',
+    '.jpg': 'image/jpeg',
+    '.gif': 'image/gif'
+}
+ui_tmpdir = '/tmp/ui/'
+upload_workers = int(os.environ.get('UPLOAD_WORKERS') or 16)
+delete_batch_size = 1000
+
+def ContentType(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in content_types:
+        return content_types[extension]
+    return mimetypes.guess_type(filename)[0] or 'binary/octet-stream'
+
+def RunParallel(function, items, workers):
+    # Runs function over items on a pool of threads; raises the first error
+    tasks = Queue.Queue()
+    for item in items:
+        tasks.put(item)
+    errors = []
+    def worker():
+        while not errors:
+            try:
+                item = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                function(item)
+            except Exception as e:
+                errors.append(e)
+    threads = [threading.Thread(target=worker) for i in range(min(workers, max(tasks.qsize(), 1)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+def UploadFile(s3, bucket, key, local_path, acl):
+    # ACL and ContentType travel with the object in a single PUT
+    log.info("Uploading %s...", key)
+    with open(local_path, 'rb') as body:
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ACL=acl,
+                      ContentType=ContentType(local_path))
+
+def ListKeys(s3, bucket, prefix):
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for s3object in response.get('Contents', []):
+            yield s3object['Key']
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+def DeleteKeys(s3, bucket, keys):
+    for i in range(0, len(keys), delete_batch_size):
+        batch = keys[i:i + delete_batch_size]
+        log.info("Deleting %d objects from %s", len(batch), bucket)
+        response = s3.delete_objects(Bucket=bucket, Delete={
+            'Objects': [{'Key': key} for key in batch],
+            'Quiet': True
+        })
+        if response.get('Errors'):
+            raise Exception("Failed to delete %s" % ', '.join(
+                error['Key'] for error in response['Errors']))
+
+def DeployImageHandlerUI(deploy_config, s3=None):
     #Expected dict entries
     #deploy_config['UISourceURL']
     #deploy_config['UIBucket']
@@ -46,7 +123,7 @@ def DeployImageHandlerUI(deploy_config):
     try:
         SrcBucket, SrcKey = deploy_config['UISourceURL'].split("/", 1)
         FileName = SrcKey.rsplit("/", 1)[1]
-        tmpdir = '/tmp/ui/'
+        tmpdir = ui_tmpdir
         log.info("%s/%s - downloading to %s%s", SrcBucket, SrcKey, tmpdir, FileName)
 
         #Clean up exisitng directories or files
@@ -57,7 +134,8 @@ def DeployImageHandlerUI(deploy_config):
         if os.path.exists(FilePath):
             os.remove(FilePath)
 
-        s3 = boto3.client("s3", config=Config(signature_version='s3v4'))
+        if s3 is None:
+            s3 = boto3.client("s3", config=Config(signature_version='s3v4'))
         s3.download_file(SrcBucket, SrcKey, FilePath)
         log.info("File downloaded to %s", FilePath)
         log.info("Extracting %s to %s", FilePath, tmpdir)
@@ -84,53 +162,44 @@ def DeployImageHandlerUI(deploy_config):
             indexfile.write(index_html)
             indexfile.close()
 
-            log.info("Uploading %s/* to %s/%s", tmpdir, deploy_config['UIBucket'], deploy_config['UIPrefix'])
-            # Grant bucket owner full control of objects (in case this is deployed to another account's bucket)
-            extraArgs = {'ACL':'bucket-owner-full-control'}
-            log.debug("ExtraArgs = %s", extraArgs)
-            for root, dirs, files in os.walk(tmpdir):
-                for filename in files:
-                    # construct the full local path
-                    local_path = os.path.join(root, filename)
-                    # construct the full UI path
-                    relative_path = os.path.relpath(local_path, tmpdir)
-                    s3_path = os.path.join(deploy_config['UIPrefix'], relative_path)
-                    log.debug("local_path = %s; relative_path = %s", local_path, relative_path)
-                    log.info("Uploading %s...", s3_path)
-                    # Setting content type
-                    if filename.endswith('.htm') or filename.endswith('.html'):
-                        extraArgs.update({"ContentType": "text/html"})
-                    if filename.endswith('.css'):
-                        extraArgs.update({"ContentType": "text/css"})
-                    if filename.endswith('.js'):
-                        extraArgs.update({"ContentType": "application/javascript"})
-                    if filename.endswith('.png'):
-                        extraArgs.update({"ContentType": "image/png"})
-                    if filename.endswith('.jpeg') or filename.endswith('.jpg'):
-                        extraArgs.update({"ContentType": "image/jpeg"})
-                    if filename.endswith('.gif'):
-                        extraArgs.update({"ContentType": "image/gif"})
-                    s3.upload_file(Filename=local_path, Bucket=deploy_config['UIBucket'], Key=s3_path, ExtraArgs=extraArgs)
-                    # Make files publically accessible if requested during CFN launch
-                    if deploy_config['UIPublicRead'] == "Yes":
-                        s3.put_object_acl(ACL='public-read', Bucket=deploy_config['UIBucket'], Key=s3_path)
+        log.info("Uploading %s/* to %s/%s", tmpdir, deploy_config['UIBucket'], deploy_config['UIPrefix'])
+        # Make files publically accessible if requested during CFN launch,
+        # otherwise grant bucket owner full control of objects (in case this
+        # is deployed to another account's bucket)
+        if deploy_config['UIPublicRead'] == "Yes":
+            acl = 'public-read'
+        else:
+            acl = 'bucket-owner-full-control'
+        uploads = []
+        for root, dirs, files in os.walk(tmpdir):
+            for filename in files:
+                # construct the full local path
+                local_path = os.path.join(root, filename)
+                # construct the full UI path
+                relative_path = os.path.relpath(local_path, tmpdir)
+                s3_path = os.path.join(deploy_config['UIPrefix'], relative_path)
+                log.debug("local_path = %s; relative_path = %s", local_path, relative_path)
+                uploads.append((s3_path, local_path))
+        RunParallel(
+            lambda upload: UploadFile(s3, deploy_config['UIBucket'], upload[0], upload[1], acl),
+            uploads, upload_workers)
     except Exception as e:
         log.error("Error uploading UI. Error: %s", e)
         raise
 
-def DeleteImageHandlerUI(deploy_config):
+def DeleteImageHandlerUI(deploy_config, s3=None):
     #Expected dict entries
     #deploy_config['UIBucket']
     #deploy_config['UIPrefix']
     log.info("Deleting Serverless Image Handler UI from %s/%s", deploy_config['UIBucket'], deploy_config['UIPrefix'])
     try:
-        s3 = boto3.client("s3", config=Config(signature_version='s3v4'))
+        if s3 is None:
+            s3 = boto3.client("s3", config=Config(signature_version='s3v4'))
         log.info("Listing UI objects in %s/%s", deploy_config['UIBucket'], deploy_config['UIPrefix'])
-        for s3object in s3.list_objects(Bucket=deploy_config['UIBucket'], Prefix=deploy_config['UIPrefix'])['Contents']:
-            log.info("Deleting %s/%s", deploy_config['UIBucket'], s3object['Key'])
-            s3.delete_object(Bucket=deploy_config['UIBucket'], Key=s3object['Key'])
-        log.info("Deleting %s/%s", deploy_config['UIBucket'], deploy_config['UIPrefix'])
-        s3.delete_object(Bucket=deploy_config['UIBucket'], Key=deploy_config['UIPrefix'])
+        keys = list(ListKeys(s3, deploy_config['UIBucket'], deploy_config['UIPrefix']))
+        if deploy_config['UIPrefix'] and deploy_config['UIPrefix'] not in keys:
+            keys.append(deploy_config['UIPrefix'])
+        DeleteKeys(s3, deploy_config['UIBucket'], keys)
 
     except Exception as e:
         log.error("Error deleting UI. Error: %s", e)
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import shutil
+import tempfile
+import threading
+import unittest
+from zipfile import ZipFile
+from mock import patch
+from image_handler_custom_resource import deploy_ui
+
+
+class S3StandIn(object):
+    '''In-memory stand-in for the boto3 S3 client calls deploy_ui makes.'''
+
+    def __init__(self, page_size=1000):
+        self.objects = {}
+        self.page_size = page_size
+        self.sources = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def record(self, name):
+        with self.lock:
+            self.calls.append(name)
+
+    def download_file(self, bucket, key, filename):
+        self.record('download_file')
+        shutil.copy(self.sources[(bucket, key)], filename)
+
+    def put_object(self, Bucket, Key, Body, ACL, ContentType):
+        self.record('put_object')
+        with self.lock:
+            self.objects[(Bucket, Key)] = {
+                'Body': Body.read(), 'ACL': ACL, 'ContentType': ContentType}
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        self.record('list_objects_v2')
+        keys = sorted(key for bucket, key in self.objects
+                      if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {'Contents': [{'Key': key} for key in page],
+                    'IsTruncated': start + self.page_size < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + self.page_size)
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        self.record('delete_objects')
+        assert len(Delete['Objects']) <= 1000
+        for entry in Delete['Objects']:
+            self.objects.pop((Bucket, entry['Key']), None)
+        return {}
+
+
+class deploy_ui_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.s3 = S3StandIn()
+        archive = self.tmpdir + '/ui.zip'
+        with ZipFile(archive, 'w') as zipf:
+            zipf.writestr('index.html', '<p>API_ENDPOINT</p>')
+            zipf.writestr('css/style.css', 'body {}')
+            zipf.writestr('img/logo.png', 'png')
+        self.s3.sources[('source', 'ui/ui.zip')] = archive
+        self.config = {
+            'UISourceURL': 'source/ui/ui.zip',
+            'UIBucket': 'site',
+            'UIPrefix': 'ui/',
+            'UIPublicRead': 'Yes',
+            'FindReplace': 'API_ENDPOINT|https://example.com',
+            'Deliminator': '|'
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def deploy(self):
+        with patch.object(deploy_ui, 'ui_tmpdir', self.tmpdir + '/ui/'):
+            deploy_ui.DeployImageHandlerUI(self.config, s3=self.s3)
+
+    def test_upload_sets_acl_and_type_in_one_request(self):
+        self.deploy()
+        self.assertEqual(self.s3.calls.count('put_object'), 3)
+        index = self.s3.objects[('site', 'ui/index.html')]
+        self.assertEqual(index['Body'], '<p>https://example.com</p>')
+        self.assertEqual(index['ACL'], 'public-read')
+        self.assertEqual(index['ContentType'], 'text/html')
+        self.assertEqual(
+            self.s3.objects[('site', 'ui/css/style.css')]['ContentType'],
+            'text/css')
+        self.assertEqual(
+            self.s3.objects[('site', 'ui/img/logo.png')]['ContentType'],
+            'image/png')
+
+    def test_private_upload(self):
+        self.config['UIPublicRead'] = 'No'
+        self.deploy()
+        self.assertEqual(self.s3.objects[('site', 'ui/index.html')]['ACL'],
+                         'bucket-owner-full-control')
+
+    def test_delete_pages_and_batches(self):
+        self.s3.page_size = 1000
+        for i in range(2500):
+            self.s3.objects[('site', 'ui/%04d.js' % i)] = {}
+        self.s3.objects[('site', 'other.js')] = {}
+        deploy_ui.DeleteImageHandlerUI(self.config, s3=self.s3)
+        self.assertEqual(self.s3.objects.keys(), [('site', 'other.js')])
+        self.assertEqual(self.s3.calls.count('list_objects_v2'), 3)
+        self.assertEqual(self.s3.calls.count('delete_objects'), 3)
+
+if __name__ == '__main__':
+    unittest.main()
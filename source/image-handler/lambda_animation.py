@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Renders animated GIFs with gifsicle instead of Thumbor's PIL engine,
+which decodes every frame into a full RGBA image. gifsicle works on the
+palette-indexed frames, so a long banner costs a fraction of the memory
+and time.
+
+Animations with more than ANIMATION_MAX_FRAMES frames or more than
+ANIMATION_MAX_PIXELS pixels across all frames are answered with their
+first frame only. With ANIMATION_WEBP=Yes, clients that accept WebP get an
+animated WebP from gif2webp, and the gifv() filter turns the animation into
+an MP4 (or gifv(webm) into a WebM) with ffmpeg, as Thumbor's gifv
+optimizer would.'''
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+gif_headers = ('GIF87a', 'GIF89a')
+# filters the fast path can honour; any other one goes to Thumbor
+fast_filters = re.compile(r'^(quality\(\d+\)|gifv\((mp4|webm)?\)|'
+                          r'format\((gif|webp)\))$')
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def enabled():
+    return str(os.environ.get('ANIMATION_ENABLED')).upper() == 'YES'
+
+
+def max_frames():
+    return int(os.environ.get('ANIMATION_MAX_FRAMES') or 300)
+
+
+def max_pixels():
+    return int(os.environ.get('ANIMATION_MAX_PIXELS') or 100 * 1000 * 1000)
+
+
+def webp_enabled():
+    return str(os.environ.get('ANIMATION_WEBP')).upper() == 'YES'
+
+
+def skip_color_table(data, i, flags):
+    if flags & 0x80:
+        i += 3 << ((flags & 7) + 1)
+    return i
+
+
+def frame_info(data, limit=None):
+    '''Logical screen size and frame count of a GIF, read from its block
+    structure without decoding any pixels. Counting stops past limit
+    frames. None when data is not a well-formed GIF.'''
+    if data[:6] not in gif_headers or len(data) < 13:
+        return None
+    width = ord(data[6]) | ord(data[7]) << 8
+    height = ord(data[8]) | ord(data[9]) << 8
+    frames = 0
+    try:
+        i = skip_color_table(data, 13, ord(data[10]))
+        while limit is None or frames <= limit:
+            block = data[i]
+            i += 1
+            if block == '\x3B':
+                break
+            if block == '\x21':
+                i += 1
+            elif block == '\x2C':
+                frames += 1
+                i = skip_color_table(data, i + 9, ord(data[i + 8]))
+                # LZW minimum code size
+                i += 1
+            else:
+                return None
+            while True:
+                size = ord(data[i])
+                i += 1
+                if not size:
+                    break
+                i += size
+    except IndexError:
+        # truncated after the last complete frame
+        pass
+    return width, height, frames
+
+
+def filter_names(values):
+    return [name for name in (values['filters'] or '').split(':') if name]
+
+
+def supported(values, config):
+    '''True when gifsicle can produce what Thumbor would for these
+    options. Smart crops fall back to the alignment, as Thumbor's own
+    gifsicle engine does.'''
+    if values['debug'] or values['meta'] or values['trim']:
+        return False
+    if values['fit_in'] and (values['adaptive'] or values['full']):
+        return False
+    if config.get('MAX_WIDTH', 0) or config.get('MAX_HEIGHT', 0):
+        return False
+    names = filter_names(values)
+    if not all(fast_filters.match(name) for name in names):
+        return False
+    # an explicit format must not quietly come back as a GIF
+    if 'format(webp)' in names and not (
+            webp_enabled() and available(config.get('GIF2WEBP_PATH'))):
+        return False
+    if any(name.startswith('gifv(') for name in names) and\
+       not available(config.get('FFMPEG_PATH')):
+        return False
+    return True
+
+
+def output_type(values, accepts_webp):
+    for name in filter_names(values):
+        if name.startswith('gifv('):
+            return 'webm' if 'webm' in name else 'mp4'
+        if name == 'format(webp)':
+            accepts_webp = True
+        elif name == 'format(gif)':
+            accepts_webp = False
+    if accepts_webp and webp_enabled():
+        return 'webp'
+    return 'gif'
+
+
+def quality(values, default):
+    match = re.search(r'quality\((\d+)\)', values['filters'] or '')
+    if match is None:
+        return default
+    return int(match.group(1))
+
+
+def dimension(value, source):
+    if value == 'orig':
+        return source
+    return value or 0
+
+
+def align(extra, alignment, start, end):
+    if alignment == start:
+        return 0
+    if alignment == end:
+        return extra
+    return extra / 2
+
+
+def gifsicle_arguments(values, width, height, first_frame=False):
+    '''gifsicle options reproducing Thumbor's manual crop, fill crop,
+    resize and flips over a width x height animation.'''
+    left, top, right, bottom = 0, 0, width, height
+    crop = values['crop']
+    if crop['right'] > crop['left'] and crop['bottom'] > crop['top']:
+        left, top = crop['left'], crop['top']
+        right, bottom = min(crop['right'], width), min(crop['bottom'], height)
+    target_width = dimension(values['width'], right - left)
+    target_height = dimension(values['height'], bottom - top)
+    resize = []
+    if values['fit_in'] and (target_width or target_height):
+        resize = ['--resize-fit', '%sx%s' % (target_width or '_',
+                                             target_height or '_')]
+    elif target_width and target_height:
+        source_width, source_height = right - left, bottom - top
+        if source_width * target_height > source_height * target_width:
+            kept = source_height * target_width / target_height
+            left += align(source_width - kept, values['halign'],
+                          'left', 'right')
+            right = left + kept
+        else:
+            kept = source_width * target_height / target_width
+            top += align(source_height - kept, values['valign'],
+                         'top', 'bottom')
+            bottom = top + kept
+        resize = ['--resize', '%dx%d' % (target_width, target_height)]
+    elif target_width:
+        resize = ['--resize-width', str(target_width)]
+    elif target_height:
+        resize = ['--resize-height', str(target_height)]
+    arguments = ['--no-warnings', '-O2']
+    if (left, top, right, bottom) != (0, 0, width, height):
+        arguments += ['--crop', '%d,%d-%d,%d' % (left, top, right, bottom)]
+    if values['horizontal_flip']:
+        arguments.append('--flip-horizontal')
+    if values['vertical_flip']:
+        arguments.append('--flip-vertical')
+    arguments += resize + ['-']
+    if first_frame:
+        arguments.append('#0')
+    return arguments
+
+
+def run(command, data=None, timeout=None):
+    '''Runs command over data, killing it after timeout seconds.'''
+    process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timer = None
+    expired = []
+    if timeout is not None:
+        def kill():
+            expired.append(True)
+            process.kill()
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        output, error = process.communicate(data)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if expired:
+        raise RenderTimeout(command[0])
+    if process.returncode != 0:
+        raise RuntimeError('%s: %s' % (command[0], error.strip()))
+    return output
+
+
+def convert(command, data, suffix, timeout=None):
+    '''Runs a converter that only takes file names: {input} and {output}
+    in command are replaced with temporary files.'''
+    workdir = tempfile.mkdtemp(prefix='animation-')
+    source = os.path.join(workdir, 'source.gif')
+    target = os.path.join(workdir, 'target.' + suffix)
+    try:
+        with open(source, 'wb') as f:
+            f.write(data)
+        run([source if part == '{input}' else
+             target if part == '{output}' else part
+             for part in command], timeout=timeout)
+        with open(target, 'rb') as f:
+            return f.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def ffmpeg_command(config, output):
+    if output == 'webm':
+        codec = ['-c:v', 'libvpx', '-b:v', '0']
+    else:
+        codec = ['-c:v', 'libx264', '-profile:v', 'baseline']
+    return [config.get('FFMPEG_PATH'), '-y', '-f', 'gif', '-i', '{input}',
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-an',
+            '-movflags', 'faststart', '-f', output, '-pix_fmt', 'yuv420p'] +\
+        codec + ['-qmin', '10', '-qmax', '42', '-crf', '23',
+                 '-maxrate', '500k', '{output}', '-loglevel', 'error']
+
+
+def available(path):
+    return bool(path) and os.path.exists(path)
+
+
+def render(config, values, data, accepts_webp, timeout=None):
+    '''Returns (content type, body, capped) for an animated GIF source, or
+    None when data is not animated or a tool is missing. Raises
+    RenderTimeout when timeout seconds run out.'''
+    info = frame_info(data, max_frames())
+    if info is None or info[2] < 2:
+        return None
+    width, height, frames = info
+    gifsicle = config.get('GIFSICLE_PATH')
+    if not available(gifsicle):
+        return None
+    capped = frames > max_frames() or width * height * frames > max_pixels()
+    body = run([gifsicle] + gifsicle_arguments(values, width, height,
+                                                first_frame=capped),
+               data, timeout)
+    output = output_type(values, accepts_webp)
+    if output == 'webp' and available(config.get('GIF2WEBP_PATH')):
+        webp_quality = config.get('WEBP_QUALITY') or config.get('QUALITY')
+        body = convert(
+            [config.get('GIF2WEBP_PATH'), '-quiet', '-mixed', '-q',
+             str(quality(values, webp_quality)), '{input}', '-o',
+             '{output}'], body, 'webp', timeout)
+        return 'image/webp', body, capped
+    if output in ('mp4', 'webm') and not capped and\
+       available(config.get('FFMPEG_PATH')):
+        body = convert(ffmpeg_command(config, output), body, output, timeout)
+        return 'video/' + output, body, capped
+    return 'image/gif', body, capped
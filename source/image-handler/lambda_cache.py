@@ -0,0 +1,485 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    '''Bounded mapping whose entries expire after ttl seconds.'''
+
+    def __init__(self, max_entries=1024, ttl=60, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            while self.entries and len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[key] = (self.clock() + self.ttl, value)
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is None or entry[0] <= self.clock():
+            return None
+        return entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Evictions': self.evictions,
+            'Entries': len(self.entries)
+        }
+
+
+class NegativeCache(TTLCache):
+    '''Bounded, TTL'd set of source keys known to be missing.'''
+
+    def contains(self, key):
+        return self.get(key) is not None
+
+    def add(self, key):
+        self.put(key, True)
+
+
+class LRUCache(TTLCache):
+    '''Bounded mapping that evicts the least recently used entry.'''
+
+    def __init__(self, max_entries=1024):
+        super(LRUCache, self).__init__(max_entries, ttl=None)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            while self.entries and len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[key] = value
+
+
+class FrequencySketch(object):
+    '''Count-min sketch with periodic halving, as used by TinyLFU to
+    estimate how often a key was requested recently.'''
+
+    depth = 4
+    max_count = 15
+
+    def __init__(self, width=4096):
+        self.width = width
+        self.seeds = [0x9e3779b1 * (i + 1) for i in range(self.depth)]
+        self.table = [[0] * width for i in range(self.depth)]
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def indexes(self, key):
+        for row, seed in enumerate(self.seeds):
+            yield row, hash((seed, key)) % self.width
+
+    def increment(self, key):
+        for row, index in self.indexes(key):
+            if self.table[row][index] < self.max_count:
+                self.table[row][index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key):
+        return min(self.table[row][index] for row, index in self.indexes(key))
+
+    def reset(self):
+        for row in self.table:
+            for index in range(self.width):
+                row[index] >>= 1
+        self.additions /= 2
+
+
+class CacheTier(object):
+    '''Base class for one level of the result cache.'''
+
+    name = 'tier'
+    shared = False
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def record(self, result):
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.bytes_served += len(result['body'])
+        return result
+
+    def victim(self, size):
+        '''Key that would be evicted to make room for size bytes.'''
+        return None
+
+    def stats(self):
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'BytesServed': self.bytes_served,
+            'BytesStored': self.bytes_stored,
+            'Evictions': self.evictions,
+            'Rejections': self.rejections
+        }
+
+
+class MemoryTier(CacheTier):
+    '''Byte-bounded LRU of rendered results held in this process.'''
+
+    name = 'Memory'
+
+    def __init__(self, max_bytes):
+        super(MemoryTier, self).__init__(max_bytes)
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.pop(key, None)
+            if result is not None:
+                self.entries[key] = result
+            return self.record(result)
+
+    def victim(self, size):
+        with self.lock:
+            if self.size + size <= self.max_bytes or not self.entries:
+                return None
+            return next(iter(self.entries))
+
+    def put(self, key, result):
+        size = len(result['body'])
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous['body'])
+            while self.entries and self.size + size > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted['body'])
+                self.evictions += 1
+            self.entries[key] = result
+            self.size += size
+            self.bytes_stored += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        result = super(MemoryTier, self).stats()
+        result['Bytes'] = self.size
+        result['Entries'] = len(self.entries)
+        return result
+
+
+class DiskTier(CacheTier):
+    '''Byte-bounded LRU of rendered results under a local directory such
+    as /tmp. Each file holds a JSON header line followed by the body.
+    Several processes may share the directory: files written by the
+    others are picked up on lookup, and the bound then holds per process.'''
+
+    name = 'Disk'
+
+    def __init__(self, root, max_bytes):
+        super(DiskTier, self).__init__(max_bytes)
+        self.root = root
+        self.entries = OrderedDict()
+        self.size = 0
+        self.load_index()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def load_index(self):
+        found = []
+        for directory, dirs, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                stat = os.stat(os.path.join(directory, filename))
+                found.append((stat.st_mtime, filename, stat.st_size))
+        for mtime, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+    def adopt(self, key):
+        try:
+            size = os.stat(self.path(key)).st_size
+        except OSError:
+            return False
+        self.entries[key] = size
+        self.size += size
+        return True
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries and not self.adopt(key):
+                return self.record(None)
+            self.entries[key] = self.entries.pop(key)
+        try:
+            with open(self.path(key), 'rb') as cached:
+                result = json.loads(cached.readline())
+                result['body'] = cached.read()
+        except (IOError, OSError, ValueError) as error:
+            logging.debug('disk cache read error: %s' % (error))
+            self.discard(key)
+            return self.record(None)
+        return self.record(result)
+
+    def victim(self, size):
+        with self.lock:
+            if self.size + size <= self.max_bytes or not self.entries:
+                return None
+            return next(iter(self.entries))
+
+    def put(self, key, result):
+        metadata = dict((k, v) for k, v in result.items() if k != 'body')
+        data = json.dumps(metadata) + '\n' + result['body']
+        path = self.path(key)
+        with self.lock:
+            self.discard(key)
+            while self.entries and self.size + len(data) > self.max_bytes:
+                self.discard(next(iter(self.entries)))
+                self.evictions += 1
+            try:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path + '.tmp', 'wb') as cached:
+                    cached.write(data)
+                os.rename(path + '.tmp', path)
+            except (IOError, OSError) as error:
+                logging.error('disk cache write error: %s' % (error))
+                return
+            self.entries[key] = len(data)
+            self.size += len(data)
+            self.bytes_stored += len(data)
+
+    def discard(self, key):
+        with self.lock:
+            size = self.entries.pop(key, None)
+            if size is None:
+                return
+            self.size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.discard(key)
+
+    def stats(self):
+        result = super(DiskTier, self).stats()
+        result['Bytes'] = self.size
+        result['Entries'] = len(self.entries)
+        return result
+
+
+class TieredCache(object):
+    '''Looks results up tier by tier, promoting hits into the faster
+    tiers. Local tiers only admit a result when the frequency sketch rates
+    it above the entry it would evict, so one-off URLs cannot flush hot
+    ones; shared tiers always accept writes, which they make in the
+    background.'''
+
+    def __init__(self, tiers, sketch=None):
+        self.tiers = tiers
+        self.sketch = sketch or FrequencySketch()
+
+    def admit(self, tier, key, result):
+        size = len(result['body'])
+        if size > tier.max_bytes:
+            tier.rejections += 1
+            return False
+        victim = tier.victim(size)
+        if victim is None:
+            return True
+        if self.sketch.frequency(key) > self.sketch.frequency(victim):
+            return True
+        tier.rejections += 1
+        return False
+
+    def get(self, key, include_shared=True):
+        self.sketch.increment(key)
+        for position, tier in enumerate(self.tiers):
+            if tier.shared and not include_shared:
+                continue
+            result = tier.get(key)
+            if result is not None:
+                for upper in self.tiers[:position]:
+                    if not upper.shared and self.admit(upper, key, result):
+                        upper.put(key, result)
+                return result
+        return None
+
+    def put(self, key, result):
+        for tier in self.tiers:
+            if tier.shared or self.admit(tier, key, result):
+                tier.put(key, result)
+
+    def clear(self):
+        for tier in self.tiers:
+            if not tier.shared:
+                tier.clear()
+
+    def stats(self):
+        return dict((tier.name, tier.stats()) for tier in self.tiers)
+
+
+negative_cache = None
+result_cache = None
+# other per-container caches, emptied with the memory tier under pressure
+trimmed = []
+
+
+def register(cache):
+    '''Adds cache to the ones trim() clears and returns it.'''
+    trimmed.append(cache)
+    return cache
+
+
+def negative_cache_enabled():
+    return str(os.environ.get('NEGATIVE_CACHE_ENABLED')).upper() == 'YES'\
+        and negative_cache_size() > 0
+
+
+def negative_cache_size():
+    return int(os.environ.get('NEGATIVE_CACHE_SIZE') or 1024)
+
+
+def negative_cache_ttl():
+    return int(os.environ.get('NEGATIVE_CACHE_TTL') or 60)
+
+
+def get_negative_cache():
+    global negative_cache
+    if negative_cache is None:
+        negative_cache = NegativeCache(
+            max_entries=negative_cache_size(),
+            ttl=negative_cache_ttl()
+        )
+        logging.debug(
+            'negative cache created: %d entries, %ds ttl',
+            negative_cache.max_entries, negative_cache.ttl
+        )
+    return negative_cache
+
+
+def get_result_cache(shared_tier=None):
+    '''Creates the process-wide result cache on first use. shared_tier is
+    a callable returning the cross-container tier, or None.'''
+    global result_cache
+    if result_cache is None:
+        tiers = []
+        memory_bytes = int(os.environ.get('RESULT_CACHE_MEMORY_BYTES') or
+                           64 * 1024 * 1024)
+        if memory_bytes > 0:
+            tiers.append(MemoryTier(memory_bytes))
+        disk_bytes = int(os.environ.get('RESULT_CACHE_DISK_BYTES') or
+                         256 * 1024 * 1024)
+        if disk_bytes > 0:
+            tiers.append(DiskTier(
+                os.environ.get('RESULT_CACHE_DISK_PATH') or
+                '/tmp/result_cache',
+                disk_bytes
+            ))
+        if shared_tier is not None:
+            tier = shared_tier()
+            if tier is not None:
+                tiers.append(tier)
+        result_cache = TieredCache(tiers)
+        logging.debug(
+            'result cache created: %s',
+            ', '.join(tier.name for tier in tiers)
+        )
+    return result_cache
+
+
+def trim():
+    '''Drops the results held in process memory, keeping the disk and
+    shared tiers, and empties every registered cache.'''
+    for cache in trimmed:
+        cache.clear()
+    if result_cache is None:
+        return
+    for tier in result_cache.tiers:
+        if isinstance(tier, MemoryTier):
+            tier.clear()
+
+
+def stats():
+    result = {}
+    if negative_cache is not None:
+        result['NegativeCache'] = negative_cache.stats()
+    if result_cache is not None:
+        result['ResultCache'] = result_cache.stats()
+    return result
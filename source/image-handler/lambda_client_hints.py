@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import os
+from image_handler import lambda_operations
+
+# legacy names first, then the Sec-CH- names current browsers send
+hint_headers = {
+    'dpr': ['DPR', 'Sec-CH-DPR'],
+    'width': ['Width', 'Sec-CH-Width'],
+    'save_data': ['Save-Data']
+}
+accept_ch = 'DPR, Width, Sec-CH-DPR, Sec-CH-Width'
+vary = 'DPR, Width, Sec-CH-DPR, Sec-CH-Width, Save-Data'
+
+
+def enabled():
+    return str(os.environ.get('CLIENT_HINTS_ENABLED')).upper() == 'YES'
+
+
+def buckets():
+    value = os.environ.get('CLIENT_HINTS_BUCKETS') or\
+        '320,480,640,800,1080,1280,1600,1920,2560'
+    return sorted(int(width) for width in value.split(',') if width.strip())
+
+
+def header(headers, names):
+    lowered = dict((key.lower(), value)
+                   for key, value in (headers or {}).items())
+    for name in names:
+        if name.lower() in lowered:
+            return lowered[name.lower()]
+    return None
+
+
+def number(value, cast):
+    try:
+        value = cast(str(value).strip().strip('"'))
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    return value
+
+
+def read_hints(headers):
+    max_dpr = float(os.environ.get('CLIENT_HINTS_MAX_DPR') or 3)
+    dpr = number(header(headers, hint_headers['dpr']), float)
+    save_data = header(headers, hint_headers['save_data'])
+    return {
+        'dpr': min(dpr, max_dpr) if dpr else None,
+        'width': number(header(headers, hint_headers['width']), int),
+        'save_data': str(save_data).strip().lower() == 'on'
+    }
+
+
+def quantize(width):
+    '''Smallest configured bucket that covers width, or the largest one.'''
+    sizes = buckets()
+    for size in sizes:
+        if size >= width:
+            return size
+    return sizes[-1]
+
+
+def is_sized(value):
+    return isinstance(value, int) and value > 0
+
+
+def resizes(values):
+    '''True when the request asks for a size. Hints never turn a request
+    for the original into a resize.'''
+    return is_sized(values['width']) or is_sized(values['height'])
+
+
+def target_width(values, hints):
+    width = values['width']
+    if not is_sized(width):
+        return None
+    if hints['width']:
+        return hints['width']
+    dpr = hints['dpr'] or 1.0
+    if dpr <= 1:
+        return None
+    return int(round(width * dpr))
+
+
+def apply(http_path, values, headers):
+    '''Rewrites the requested size onto a width bucket and lowers quality
+    under Save-Data. Returns the path and options Thumbor should render.'''
+    if not resizes(values):
+        return http_path, values
+    hints = read_hints(headers)
+    target = target_width(values, hints)
+    if target is not None:
+        # buckets are capped, but never below the size asked for
+        target = max(quantize(target), values['width'])
+        if target == values['width']:
+            target = None
+    if target is None and not hints['save_data']:
+        return http_path, values
+    values = dict(values)
+    if target is not None:
+        width = target
+        if values['width'] and values['height']:
+            values['height'] = max(1, int(round(
+                values['height'] * width / float(values['width']))))
+        values['width'] = width
+    if hints['save_data']:
+        values['filters'] = lambda_operations.with_quality(
+            values['filters'],
+            int(os.environ.get('CLIENT_HINTS_SAVE_DATA_QUALITY') or 50)
+        )
+    prefix = '/unsafe' if http_path.startswith('/unsafe/') else ''
+    return prefix + lambda_operations.build_path(values), values
+
+
+def add_headers(response):
+    headers = response['headers']
+    headers['Accept-CH'] = accept_ch
+    if headers.get('Vary'):
+        headers['Vary'] = headers['Vary'] + ', ' + vary
+    else:
+        headers['Vary'] = vary
+    return response
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import json
+import logging
+import os
+import threading
+from image_handler import lambda_cache
+from image_handler import lambda_operations
+
+degraded_header = 'X-Image-Handler-Degraded'
+skip_optimizers_header = 'X-Image-Handler-Skip-Optimizers'
+
+# Stages are shed in this order as the remaining time drops below each
+# threshold (milliseconds).
+stage_thresholds = [
+    ('optimizers', 'DEGRADE_OPTIMIZERS_MS', 6000),
+    ('smart', 'DEGRADE_SMART_MS', 4000),
+    ('quality', 'DEGRADE_QUALITY_MS', 2500),
+    ('variant', 'DEGRADE_VARIANT_MS', 1000)
+]
+
+variants = lambda_cache.register(
+    lambda_cache.TTLCache(max_entries=4096, ttl=3600))
+variants_lock = threading.Lock()
+
+
+def enabled():
+    return str(os.environ.get('DEGRADE_ENABLED')).upper() == 'YES'
+
+
+def remaining_ms(context):
+    if not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return context.get_remaining_time_in_millis()
+
+
+def shed_stages(remaining):
+    if remaining is None or not enabled():
+        return []
+    stages = []
+    for stage, variable, default in stage_thresholds:
+        if remaining < int(os.environ.get(variable) or default):
+            stages.append(stage)
+    return stages
+
+
+def request_timeout(remaining):
+    '''Seconds to wait for Thumbor, leaving room to answer before the
+    Lambda itself is killed.'''
+    if remaining is None:
+        return None
+    margin = int(os.environ.get('DEGRADE_MARGIN_MS') or 500)
+    return max(remaining - margin, 100) / 1000.0
+
+
+def degrade_path(operations, stages):
+    '''Path shedding smart detection and full quality, rebuilt from the
+    parsed options so filter arguments containing / survive.'''
+    if 'smart' not in stages and 'quality' not in stages:
+        return operations.path
+    values = dict(operations.values)
+    if 'smart' in stages:
+        values['smart'] = False
+    if 'quality' in stages:
+        values['filters'] = lambda_operations.with_quality(
+            values['filters'],
+            int(os.environ.get('DEGRADED_QUALITY') or 60))
+    return lambda_operations.derive(operations, values).path
+
+
+def degraded_cache_control():
+    return 'max-age=%d,public' % int(os.environ.get('DEGRADED_MAX_AGE') or 60)
+
+
+def variant_key(values, output_format):
+    '''Renders are only interchangeable when everything but their size
+    matches: filters, crop, smart, fit-in and flips included.'''
+    options = dict(values)
+    del options['width']
+    del options['height']
+    return json.dumps(options, sort_keys=True), output_format
+
+
+def record_variant(values, output_format, digest):
+    width, height = values['width'], values['height']
+    if not isinstance(width, int) or not isinstance(height, int) or\
+       not width or not height:
+        return
+    key = variant_key(values, output_format)
+    with variants_lock:
+        # a fresh dict, so readers never see one being changed
+        known = dict(variants.get(key) or {})
+        known[digest] = (width, height)
+        variants.put(key, known)
+
+
+def smaller_variants(values, output_format):
+    '''Digests of renders with the same options that fit inside the
+    requested box, largest first.'''
+    width, height = values['width'], values['height']
+    known = variants.get(variant_key(values, output_format)) or {}
+    candidates = []
+    for digest, size in known.items():
+        if isinstance(width, int) and width and size[0] > width:
+            continue
+        if isinstance(height, int) and height and size[1] > height:
+            continue
+        candidates.append((size[0] * size[1], digest))
+    return [digest for area, digest in sorted(candidates, reverse=True)]
+
+
+def install_hooks():
+    '''Lets the handler switch Thumbor optimizers off for one request.'''
+    from thumbor.handlers import BaseHandler
+    if getattr(BaseHandler.optimize, 'deadline_hook', False):
+        return
+    optimize = BaseHandler.optimize
+
+    def deadline_optimize(self, context, image_extension, results):
+        if self.request.headers.get(skip_optimizers_header):
+            logging.debug('skipping optimizers under time pressure')
+            return results
+        return optimize(self, context, image_extension, results)
+
+    deadline_optimize.deadline_hook = True
+    BaseHandler.optimize = deadline_optimize
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import json
+import logging
+import os
+from botocore.exceptions import ClientError
+from thumbor.storages import BaseStorage
+from tornado.concurrent import return_future
+from image_handler import lambda_cache
+from image_handler import lambda_result_storage
+
+# Focal points keyed by source ETag, shared by every Storage instance in
+# this process (Thumbor builds a new one per request).
+focal_points = lambda_cache.register(
+    lambda_cache.TTLCache(max_entries=4096, ttl=24 * 60 * 60))
+
+
+class Storage(BaseStorage):
+    '''Thumbor detector storage that remembers focal points per source
+    ETag in memory, under a local directory and optionally in the S3
+    storage bucket, so each original is only analyzed once. Meant to be
+    plugged in as MIXED_STORAGE_DETECTOR_STORAGE.'''
+
+    def etag_key(self, path):
+        etag = lambda_result_storage.source_etag(self.context.config, path)
+        if not etag:
+            return None
+        # points found on a pyramid level are in that level's coordinates
+        request = getattr(self.context, 'request', None)
+        level = getattr(request, 'pyramid_level', 1)
+        if level > 1:
+            return '%s-%d' % (etag.strip('"'), level)
+        return etag.strip('"')
+
+    def file_path(self, key):
+        root = self.context.config.get('DETECTOR_STORAGE_FILE_ROOT_PATH',
+                                       '/tmp/detectors')
+        return os.path.join(root, key + '.json')
+
+    def s3_location(self, key):
+        config = self.context.config
+        if not config.get('DETECTOR_STORAGE_S3_ENABLED', False) or\
+           not config.get('TC_AWS_STORAGE_BUCKET'):
+            return None, None
+        root = '/'.join([config.get('TC_AWS_STORAGE_ROOT_PATH', ''),
+                         config.get('DETECTOR_STORAGE_S3_ROOT_PATH',
+                                    'thumbor/detectors'),
+                         key + '.json'])
+        return config.get('TC_AWS_STORAGE_BUCKET'),\
+            lambda_result_storage.clean_key(root)
+
+    def read_file(self, key):
+        try:
+            with open(self.file_path(key)) as stored:
+                return json.load(stored)
+        except (IOError, ValueError):
+            return None
+
+    def write_file(self, key, data):
+        path = self.file_path(key)
+        try:
+            self.ensure_dir(os.path.dirname(path))
+            with open(path + '.tmp', 'w') as stored:
+                json.dump(data, stored)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError) as error:
+            logging.error('detector storage write error: %s' % (error))
+
+    def read_s3(self, key):
+        bucket, s3_key = self.s3_location(key)
+        if bucket is None:
+            return None
+        client = lambda_result_storage.s3_client(self.context.config)
+        try:
+            response = client.get_object(Bucket=bucket, Key=s3_key)
+            return json.loads(response['Body'].read())
+        except ClientError as error:
+            if not lambda_result_storage.not_found(error):
+                logging.error('detector storage read error: %s' % (error))
+        except ValueError:
+            pass
+        return None
+
+    def write_s3(self, key, data):
+        bucket, s3_key = self.s3_location(key)
+        if bucket is None:
+            return
+        client = lambda_result_storage.s3_client(self.context.config)
+        try:
+            client.put_object(Bucket=bucket, Key=s3_key,
+                              Body=json.dumps(data),
+                              ContentType='application/json')
+        except ClientError as error:
+            logging.error('detector storage write error: %s' % (error))
+
+    def put(self, path, bytes):
+        return path
+
+    def put_crypto(self, path):
+        return path
+
+    def put_detector_data(self, path, data):
+        key = self.etag_key(path)
+        if key is None:
+            return path
+        focal_points.put(key, data)
+        self.write_file(key, data)
+        self.write_s3(key, data)
+        return path
+
+    @return_future
+    def get_crypto(self, path, callback):
+        callback(None)
+
+    @return_future
+    def get_detector_data(self, path, callback):
+        key = self.etag_key(path)
+        if key is None:
+            callback(None)
+            return
+        data = focal_points.get(key)
+        if data is None:
+            data = self.read_file(key)
+            if data is None:
+                data = self.read_s3(key)
+                if data is not None:
+                    self.write_file(key, data)
+            if data is not None:
+                focal_points.put(key, data)
+        callback(data)
+
+    @return_future
+    def get(self, path, callback):
+        callback(None)
+
+    @return_future
+    def exists(self, path, callback):
+        callback(False)
+
+    def remove(self, path):
+        pass
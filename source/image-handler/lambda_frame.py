@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''thumbor.filters.frame with the nine-patch taken from lambda_overlay
+instead of being fetched and decoded for every request.'''
+
+from thumbor.ext.filters import _nine_patch
+from thumbor.filters import BaseFilter, filter_method
+from thumbor.filters import frame
+from thumbor.loaders import LoaderResult
+from image_handler import lambda_overlay
+
+
+class Filter(frame.Filter):
+
+    @filter_method(BaseFilter.String, async=True)
+    def frame(self, callback, url):
+        self.url = url
+        self.callback = callback
+        self.nine_patch_engine = self.context.modules.engine.__class__(
+            self.context)
+        if lambda_overlay.load(
+                lambda_overlay.asset_key(self.context.config, url),
+                self.nine_patch_engine):
+            self.on_decoded()
+            return
+        self.context.modules.loader.load(self.context, self.url,
+                                         self.on_fetch_done)
+
+    def on_fetch_done(self, result):
+        if isinstance(result, LoaderResult):
+            buffer = result.buffer
+        else:
+            buffer = result
+        self.on_image_ready(buffer)
+
+    def on_image_ready(self, buffer):
+        self.nine_patch_engine.load(buffer, None)
+        lambda_overlay.store(
+            lambda_overlay.asset_key(self.context.config, self.url),
+            self.nine_patch_engine)
+        self.on_decoded()
+
+    def on_decoded(self):
+        '''Applies the nine-patch as thumbor.filters.frame does.'''
+        self.nine_patch_engine.enable_alpha()
+        self.engine.enable_alpha()
+
+        nine_patch_mode, nine_patch_data =\
+            self.nine_patch_engine.image_data_as_rgb()
+        padding = _nine_patch.get_padding(nine_patch_mode,
+                                          nine_patch_data,
+                                          self.nine_patch_engine.size[0],
+                                          self.nine_patch_engine.size[1])
+
+        self.handle_padding(padding)
+
+        mode, data = self.engine.image_data_as_rgb()
+
+        if mode != nine_patch_mode:
+            raise RuntimeError('Image mode mismatch: %s != %s' % (
+                mode, nine_patch_mode)
+            )
+
+        imgdata = _nine_patch.apply(mode,
+                                    data,
+                                    self.engine.size[0],
+                                    self.engine.size[1],
+                                    nine_patch_data,
+                                    self.nine_patch_engine.size[0],
+                                    self.nine_patch_engine.size[1])
+        self.engine.set_image_data(imgdata)
+        self.callback()
@@ -18,6 +18,7 @@
 from __future__ import print_function
 import cStringIO
 import base64
+import hashlib
 import requests_unixsocket
 import threading
 import time
@@ -28,8 +29,20 @@ import json
 import os
 import timeit
 import ast
+import re
+import requests
+from email.utils import formatdate
+from image_handler import lambda_animation
+from image_handler import lambda_cache
+from image_handler import lambda_client_hints
+from image_handler import lambda_deadline
+from image_handler import lambda_memory
 from image_handler import lambda_metrics
-from image_handler import lambda_rewrite
+from image_handler import lambda_operations
+from image_handler import lambda_overlay
+from image_handler import lambda_passthrough
+from image_handler import lambda_profiler
+from image_handler import lambda_result_storage
 from PIL import Image
 from io import BytesIO
 from distutils.util import strtobool
@@ -45,10 +58,64 @@ from thumbor.server import *
 thumbor_config_path = '/var/task/image_handler/thumbor.conf'
 thumbor_socket = '/tmp/thumbor'
 unix_path = 'http+unix://%2Ftmp%2Fthumbor'
+config = None
+
+
+default_error_body = json.dumps({'message': 'error'})
+response_templates = {}
+error_responses = {}
+max_cached_responses = 256
+
+
+def cors_origin():
+    if str(os.environ.get('ENABLE_CORS')).upper() == "YES":
+        return os.environ.get('CORS_ORIGIN')
+    return None
+
+
+def bounded_store(cache, key, value):
+    if len(cache) >= max_cached_responses:
+        cache.clear()
+    cache[key] = value
+    return value
+
+
+def header_template(content_type, cache_control, vary, origin):
+    key = (content_type, cache_control, vary, origin)
+    template = response_templates.get(key)
+    if template is None:
+        template = {
+            'Content-Type': content_type,
+            'Cache-Control': cache_control
+        }
+        if origin is not None:
+            template['Access-Control-Allow-Origin'] = origin
+        if vary:
+            template['Vary'] = vary
+        bounded_store(response_templates, key, template)
+    return template
+
+
+def error_response(status_code, cache_control, content_type, vary, origin):
+    key = (str(status_code), cache_control, content_type, vary, origin)
+    cached = error_responses.get(key)
+    if cached is None:
+        cached = bounded_store(error_responses, key, {
+            'statusCode': status_code,
+            'headers': header_template(
+                content_type, cache_control, vary, origin
+            ),
+            'body': default_error_body
+        })
+    return {
+        'statusCode': cached['statusCode'],
+        'headers': dict(cached['headers']),
+        'body': cached['body']
+    }
 
 
 def response_formater(status_code='400',
-                      body={'message': 'error'},
+                      body=None,
                       cache_control='max-age=120,public',
                       content_type='application/json',
                       expires='',
@@ -56,30 +123,37 @@ def response_formater(status_code='400',
                       date='',
                       vary=False
                       ):
-
-    api_response = {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': content_type
-        }
-    }
-
-    if str(os.environ.get('ENABLE_CORS')).upper() == "YES":
-        api_response['headers']['Access-Control-Allow-Origin'] = os.environ.get('CORS_ORIGIN')
-
+    origin = cors_origin()
     if int(status_code) != 200:
-        api_response['body'] = json.dumps(body)
-        api_response['Cache-Control'] = cache_control
+        if body is None:
+            api_response = error_response(
+                status_code, cache_control, content_type, vary, origin
+            )
+        else:
+            api_response = {
+                'statusCode': status_code,
+                'headers': dict(header_template(
+                    content_type, cache_control, vary, origin
+                )),
+                'body': json.dumps(body)
+            }
     else:
-        api_response['body'] = body
-        api_response['isBase64Encoded'] = 'true'
-        api_response['headers']['Expires'] = expires
-        api_response['headers']['Etag'] = etag
-        api_response['headers']['Cache-Control'] = cache_control
-        api_response['headers']['Date'] = date
-    if vary:
-        api_response['headers']['Vary'] = vary
-    logging.debug(api_response)
+        headers = dict(header_template(
+            content_type, cache_control, vary, origin
+        ))
+        headers['Expires'] = expires
+        headers['Etag'] = etag
+        headers['Date'] = date
+        api_response = {
+            'statusCode': status_code,
+            'headers': headers,
+            'body': body,
+            'isBase64Encoded': 'true'
+        }
+    logging.debug(
+        'response status: %s headers: %s',
+        api_response['statusCode'], api_response['headers']
+    )
     return api_response
 
 def run_server(application, context):
@@ -103,6 +177,14 @@ def stop_thumbor():
         logging.error('stop_thumbor error: %s' % (error))
 
 
+def load_config():
+    global config
+    if config is None:
+        config = get_config(thumbor_config_path)
+        config.allow_environment_variables()
+    return config
+
+
 def start_thumbor():
     try:
         server_parameters = ServerParameters(
@@ -112,15 +194,15 @@ def start_thumbor():
             keyfile=False,
             log_level=log_level,
             app_class='thumbor.app.ThumborServiceApp')
-        global config
-        config = get_config(thumbor_config_path)
-        config.allow_environment_variables()
+        config = load_config()
         configure_log(config, server_parameters.log_level)
         importer = get_importer(config)
         os.environ["PATH"] += os.pathsep + '/var/task'
         validate_config(config, server_parameters)
+        lambda_deadline.install_hooks()
         with get_context(server_parameters, config, importer) as thumbor_context:
             application = get_application(thumbor_context)
+            lambda_overlay.preload_in_background(thumbor_context)
             run_server(application, thumbor_context)
             tornado.ioloop.IOLoop.instance().start()
             logging.info(
@@ -172,9 +254,7 @@ def allow_unsafe_url(http_path):
 
 
 def rewrite(http_path):
-    if str(os.environ.get('REWRITE_ENABLED')).upper() == 'YES':
-        http_path = lambda_rewrite.match_patterns(http_path)
-    return http_path
+    return lambda_operations.parse(http_path).path
 
 
 def is_thumbor_down():
@@ -198,22 +278,311 @@ def is_thumbor_down():
              proceeding with tornado server restart'
          )
          restart_server()
-         return response_formater(status_code='502')
+         return response_formater(status_code='502'), None
      return False, session
 
 
-def request_thumbor(original_request, session):
-    http_path = original_request['path']
-    http_path = rewrite(http_path);
+def not_found_response():
+    return response_formater(
+        status_code='404',
+        cache_control='max-age=%d,public' % lambda_cache.negative_cache_ttl()
+    )
+
+
+def redirect_response(location, cache_control):
+    response = response_formater(status_code='302',
+                                 cache_control=cache_control)
+    response['headers']['Location'] = location
+    response['body'] = ''
+    return response
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    if match is None:
+        return 0
+    return int(match.group(1))
+
+
+def output_format(original_request):
+    vary, request_headers = auto_webp(original_request, {})
+    if vary and 'image/webp' in request_headers.get('Accept', ''):
+        return 'webp'
+    return ''
+
+
+def result_digest(original_request, operations):
+    etag = lambda_result_storage.source_etag(config,
+                                             operations.values['image'])
+    if etag is None:
+        return None
+    return lambda_result_storage.result_key(
+        etag, operations.options, output_format(original_request),
+        (config.QUALITY, config.WEBP_QUALITY)
+    )
+
+
+def cached_response(result, vary):
+    now = time.time()
+    body = gen_body(result['content_type'], result['body'])
+    if body is None:
+        return None
+    return response_formater(
+        status_code='200',
+        body=body,
+        cache_control=result['cache_control'],
+        content_type=result['content_type'],
+        expires=http_date(now + max_age(result['cache_control'])),
+        etag=result['etag'],
+        date=http_date(now),
+        vary=vary and 'Accept'
+    )
+
+
+def is_head(original_request):
+    request_context = original_request.get('requestContext') or {}
+    return request_context.get('httpMethod') == 'HEAD'
+
+
+def head_only(response):
+    '''Drops the body of a response, keeping the length it would have had.'''
+    body = response.get('body') or ''
+    if 'Content-Length' not in response['headers']:
+        if response.get('isBase64Encoded') == 'true':
+            length = len(body) * 3 / 4 - body[-2:].count('=')
+        else:
+            length = len(body)
+        response['headers']['Content-Length'] = str(length)
+    response['body'] = ''
+    return response
+
+
+def metadata_response(metadata, vary):
+    '''HEAD answer for a render that is known but not loaded.'''
+    now = time.time()
+    response = response_formater(
+        status_code='200',
+        body='',
+        cache_control=metadata['cache_control'],
+        content_type=metadata['content_type'],
+        expires=http_date(now + max_age(metadata['cache_control'])),
+        etag=metadata['etag'],
+        date=http_date(now),
+        vary=vary and 'Accept'
+    )
+    response['headers']['Content-Length'] = str(metadata['content_length'])
+    return response
+
+
+def result_cache():
+    return lambda_cache.get_result_cache(
+        lambda: lambda_result_storage.shared_tier(config)
+    )
+
+
+def result_storage_response(original_request, digest):
+    redirect = lambda_result_storage.redirect_mode() and\
+        config.get('TC_AWS_RESULT_STORAGE_BUCKET')
+    result = result_cache().get(digest, include_shared=not redirect)
+    if result is None and redirect and\
+       lambda_result_storage.exists(config, digest):
+        expiry = int(os.environ.get('RESULT_CACHE_REDIRECT_EXPIRY') or 3600)
+        return redirect_response(
+            lambda_result_storage.presigned_url(config, digest, expiry),
+            'max-age=%d,public' % (expiry / 2)
+        )
+    if result is None:
+        return None
+    vary, request_headers = auto_webp(original_request, {})
+    return cached_response(result, vary)
+
+
+def passthrough_metadata_response(original_request, values):
+    source = lambda_result_storage.head_source(config, values['image'])
+    if source is None:
+        return None
+    content_type = source.get('ContentType')
+    if content_type not in lambda_passthrough.passthrough_types or\
+       source.get('ContentLength', 0) > lambda_passthrough.max_bytes():
+        return None
+    # jpegtran would change the length
+    if content_type == 'image/jpeg' and lambda_passthrough.optimizing():
+        return None
+    vary, request_headers = auto_webp(original_request, {})
+    return metadata_response({
+        'content_length': source['ContentLength'],
+        'content_type': content_type,
+        'cache_control': 'max-age=%d,public' % config.MAX_AGE,
+        'etag': source['ETag']
+    }, vary)
+
+
+def passthrough_response(original_request, values):
+    '''Serves the original bytes when the request leaves them unchanged,
+    without waiting on Thumbor. Signed URLs still go through Thumbor so
+    their signature gets checked.'''
+    if not bool(strtobool(str(config.ALLOW_UNSAFE_URL))) or\
+       not lambda_passthrough.is_noop(values, config) or\
+       output_format(original_request):
+        return None
+    if not lambda_result_storage.source_allowed(config, values['image']):
+        return not_found_response()
+    if is_head(original_request):
+        head = passthrough_metadata_response(original_request, values)
+        if head:
+            return head
+    source = lambda_result_storage.fetch_source(config, values['image'])
+    if source is None or len(source) > lambda_passthrough.max_bytes():
+        return None
+    content_type = lambda_passthrough.content_type(source)
+    if content_type is None:
+        return None
+    source = lambda_passthrough.optimize(config, content_type, source)
+    now = time.time()
+    vary, request_headers = auto_webp(original_request, {})
+    return response_formater(
+        status_code='200',
+        body=gen_body(content_type, source),
+        cache_control='max-age=%d,public' % config.MAX_AGE,
+        content_type=content_type,
+        expires=http_date(now + config.MAX_AGE),
+        etag=lambda_result_storage.source_etag(config, values['image']),
+        date=http_date(now),
+        vary=vary and 'Accept'
+    )
+
+
+def animation_response(original_request, values, digest, context=None):
+    '''Renders animated GIFs with gifsicle rather than Thumbor's PIL
+    engine. Signed URLs and options gifsicle cannot reproduce still go
+    through Thumbor.'''
+    if not bool(strtobool(str(config.ALLOW_UNSAFE_URL))) or\
+       not values['image'].lower().endswith('.gif') or\
+       not lambda_animation.supported(values, config):
+        return None
+    if not lambda_result_storage.source_allowed(config, values['image']):
+        return not_found_response()
+    source = lambda_result_storage.fetch_source(config, values['image'])
+    if source is None:
+        return None
+    vary, request_headers = auto_webp(original_request, {})
+    accepts_webp = 'image/webp' in request_headers.get('Accept', '')
+    try:
+        rendered = lambda_animation.render(
+            config, values, source, accepts_webp,
+            lambda_deadline.request_timeout(
+                lambda_deadline.remaining_ms(context))
+        )
+    except lambda_animation.RenderTimeout:
+        return timeout_response(original_request, values, [])
+    except (OSError, RuntimeError) as error:
+        logging.error('animation error: %s' % (error))
+        rendered = None
+    if rendered is None:
+        lambda_result_storage.hand_off_source(config, values['image'],
+                                              source)
+        return None
+    content_type, body, capped = rendered
+    result = {
+        'body': body,
+        'content_type': content_type,
+        'cache_control': 'max-age=%d,public' % config.MAX_AGE,
+        'etag': '"%s"' % hashlib.sha1(body).hexdigest()
+    }
+    # a first-frame stand-in must not outlive this response
+    if digest and not capped:
+        result_cache().put(digest, result)
+    response = cached_response(result, vary)
+    if capped:
+        response['headers'][lambda_deadline.degraded_header] = 'frames'
+    return response
+
+
+def result_metadata_response(original_request, digest):
+    '''Answers a HEAD from the local result cache tiers or, failing that,
+    from the stored render's S3 metadata, so no body is fetched.'''
+    vary, request_headers = auto_webp(original_request, {})
+    result = result_cache().get(digest, include_shared=False)
+    if result is not None:
+        metadata = dict(result, content_length=len(result['body']))
+        return metadata_response(metadata, vary)
+    if not config.get('TC_AWS_RESULT_STORAGE_BUCKET'):
+        return None
+    metadata = lambda_result_storage.head(config, digest)
+    if metadata is None:
+        return None
+    return metadata_response(metadata, vary)
+
+
+def degraded_response(response, stages):
+    if response['statusCode'] in ('200', 200):
+        response['headers']['Cache-Control'] =\
+            lambda_deadline.degraded_cache_control()
+    response['headers'][lambda_deadline.degraded_header] = ','.join(stages)
+    return response
+
+
+def variant_response(original_request, values, stages):
+    if not values or not lambda_result_storage.enabled():
+        return None
+    for digest in lambda_deadline.smaller_variants(
+            values, output_format(original_request)):
+        result = result_cache().get(digest, include_shared=False)
+        if result is not None:
+            vary, request_headers = auto_webp(original_request, {})
+            return degraded_response(
+                cached_response(result, vary), stages + ['variant']
+            )
+    return None
+
+
+def timeout_response(original_request, values, stages):
+    logging.error('call_thumbor error: render exceeded remaining time')
+    fallback = variant_response(original_request, values, stages)
+    if fallback:
+        return fallback
+    response = response_formater(status_code='503',
+                                 cache_control='no-cache,no-store')
+    response['headers']['Retry-After'] = '1'
+    return degraded_response(response, stages + ['timeout'])
+
+
+def store_result(digest, thumbor_response):
+    cache_control = thumbor_response.headers.get('Cache-Control')
+    if thumbor_response.status_code != 200 or max_age(cache_control) == 0:
+        return False
+    result_cache().put(digest, {
+        'body': thumbor_response.content,
+        'content_type': thumbor_response.headers['content-type'],
+        'cache_control': cache_control,
+        'etag': thumbor_response.headers.get('Etag', '')
+    })
+    return True
+
+
+def request_thumbor(original_request, session, http_path=None,
+                    stages=(), timeout=None):
+    if http_path is None:
+        http_path = rewrite(original_request['path'])
     http_path = allow_unsafe_url(http_path)
     request_headers = {}
     vary, request_headers = auto_webp(original_request, request_headers)
-    return session.get(unix_path + http_path, headers=request_headers), vary
+    if 'optimizers' in stages:
+        request_headers[lambda_deadline.skip_optimizers_header] = '1'
+    return session.get(unix_path + http_path, headers=request_headers,
+                       timeout=timeout), vary
 
 
 def process_thumbor_responde(thumbor_response, vary):
+     if thumbor_response.status_code == 404 and\
+        lambda_cache.negative_cache_enabled():
+         return not_found_response()
      if thumbor_response.status_code != 200:
-         return response_formater(status_code=response.status_code)
+         return response_formater(status_code=thumbor_response.status_code)
      if vary:
          vary = thumbor_response.headers['vary']
      content_type = thumbor_response.headers['content-type']
@@ -232,11 +601,100 @@ def process_thumbor_responde(thumbor_response, vary):
                               )
 
 
-def call_thumbor(original_request):
+def rewritable(http_path):
+    '''True when the path is not signed, so its options can be changed.'''
+    return bool(strtobool(str(load_config().ALLOW_UNSAFE_URL))) or\
+        http_path.startswith('/unsafe/')
+
+
+def client_hints(original_request, operations):
+    if not rewritable(operations.path):
+        return operations
+    http_path, values = lambda_client_hints.apply(
+        operations.path, operations.values, original_request.get('headers'))
+    if values is operations.values:
+        return operations
+    return lambda_operations.Operations(http_path, values)
+
+
+def call_thumbor(original_request, context=None):
+    operations = lambda_operations.parse(original_request['path'])
+    hinted = operations.values and lambda_client_hints.enabled() and\
+        lambda_client_hints.resizes(operations.values)
+    if hinted:
+        load_config()
+        operations = client_hints(original_request, operations)
+    response = render(original_request, operations, context)
+    if hinted:
+        lambda_client_hints.add_headers(response)
+    if is_head(original_request):
+        response = head_only(response)
+    return response
+
+
+def render(original_request, operations, context=None):
+    http_path, values = operations.path, operations.values
+    missing_key = None
+    if values and lambda_cache.negative_cache_enabled():
+        missing_key = values['image']
+        if lambda_cache.get_negative_cache().contains(missing_key):
+            return not_found_response()
+    if values and lambda_passthrough.enabled():
+        load_config()
+        passthrough = passthrough_response(original_request, values)
+        if passthrough:
+            return passthrough
+    digest = None
+    if values and lambda_result_storage.enabled():
+        load_config()
+        digest = result_digest(original_request, operations)
+        if digest and is_head(original_request):
+            cached = result_metadata_response(original_request, digest)
+            if cached:
+                return cached
+        if digest:
+            cached = result_storage_response(original_request, digest)
+            if cached:
+                return cached
     thumbor_down, session = is_thumbor_down()
     if thumbor_down:
         return thumbor_down
-    thumbor_response, vary = request_thumbor(original_request, session)
+    if values and lambda_animation.enabled():
+        animated = animation_response(original_request, values, digest,
+                                      context)
+        if animated:
+            return animated
+    remaining = lambda_deadline.remaining_ms(context)
+    stages = lambda_deadline.shed_stages(remaining)
+    if 'variant' in stages:
+        fallback = variant_response(original_request, values, stages[:-1])
+        if fallback:
+            return fallback
+        stages = stages[:-1]
+    if stages and values:
+        if not rewritable(http_path):
+            stages = [stage for stage in stages
+                      if stage not in ('smart', 'quality')]
+        http_path = lambda_deadline.degrade_path(operations, stages)
+    try:
+        thumbor_response, vary = request_thumbor(
+            original_request, session, http_path, stages,
+            lambda_deadline.request_timeout(remaining)
+        )
+    except requests.exceptions.Timeout:
+        return timeout_response(original_request, values, stages)
+    # a 404 for a path we hinted or degraded says nothing about the source
+    if missing_key and thumbor_response.status_code == 404 and\
+       http_path == lambda_operations.parse(original_request['path']).path:
+        lambda_cache.get_negative_cache().add(missing_key)
+    if stages:
+        return degraded_response(
+            process_thumbor_responde(thumbor_response, vary), stages
+        )
+    if digest and store_result(digest, thumbor_response):
+        lambda_deadline.record_variant(
+            values, output_format(original_request), digest
+        )
     return process_thumbor_responde(thumbor_response, vary)
 
 
@@ -277,7 +735,18 @@ def lambda_handler(event, context):
         if event['requestContext']['httpMethod'] != 'GET' and\
            event['requestContext']['httpMethod'] != 'HEAD':
             return response_formater(status_code=405)
-        result = call_thumbor(event)
+        profiler = lambda_profiler.start(event)
+        try:
+            lambda_memory.start_request()
+            result = call_thumbor(event, context)
+            lambda_memory.govern(context)
+        finally:
+            if profiler:
+                profile = lambda_profiler.finish(profiler, event, config)
+        if profiler:
+            result['headers'][lambda_profiler.header] = profile
+        if lambda_metrics.log_enabled():
+            lambda_metrics.log_data(result, start_time)
         if str(os.environ.get('SEND_ANONYMOUS_DATA')).upper() == 'YES':
             send_metrics(event, result, start_time)
         return result
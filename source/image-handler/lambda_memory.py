@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+from image_handler import lambda_cache
+
+status_path = '/proc/self/status'
+clear_refs_path = '/proc/self/clear_refs'
+libc = None
+counters = {'Trims': 0}
+last = {}
+
+
+def enabled():
+    return str(os.environ.get('MEMORY_GOVERNOR_ENABLED')).upper() == 'YES'
+
+
+def read_status():
+    '''VmRSS and VmHWM (peak RSS) of this process, in bytes.'''
+    values = {}
+    try:
+        with open(status_path) as status:
+            for line in status:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'VmHWM'):
+                    values[name] = int(value.split()[0]) * 1024
+    except (IOError, ValueError) as error:
+        logging.error('memory status error: %s' % (error))
+    return values
+
+
+def reset_peak():
+    '''Starts a new VmHWM window so the next peak is this request's own.'''
+    try:
+        with open(clear_refs_path, 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        pass
+
+
+def limit_bytes(context):
+    size = getattr(context, 'memory_limit_in_mb', None) or\
+        os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    if not size:
+        return None
+    return int(size) * 1024 * 1024
+
+
+def watermark(context):
+    limit = limit_bytes(context)
+    if limit is None:
+        return None
+    return limit * int(os.environ.get('MEMORY_WATERMARK_PERCENT') or 75) / 100
+
+
+def release_heap():
+    '''Hands freed malloc arenas (PIL and OpenCV pixel buffers end up
+    there) back to the kernel; glibc only.'''
+    global libc
+    if libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+    try:
+        libc.malloc_trim(0)
+    except AttributeError:
+        pass
+
+
+def trim():
+    lambda_cache.trim()
+    gc.collect()
+    release_heap()
+    counters['Trims'] += 1
+
+
+def start_request():
+    if enabled():
+        reset_peak()
+
+
+def govern(context):
+    '''Called after each invocation: records the request's peak RSS and,
+    above MEMORY_WATERMARK_PERCENT of the function's memory, empties the
+    in-process caches and returns freed memory to the system.'''
+    if not enabled():
+        return
+    status = read_status()
+    last['PeakRssMb'] = status.get('VmHWM', 0) / (1024 * 1024)
+    last['RssMb'] = status.get('VmRSS', 0) / (1024 * 1024)
+    threshold = watermark(context)
+    if threshold is None or status.get('VmRSS', 0) < threshold:
+        return
+    trim()
+    after = read_status().get('VmRSS', 0)
+    last['RssMb'] = after / (1024 * 1024)
+    logging.info('memory trimmed from %d to %d bytes',
+                 status['VmRSS'], after)
+
+
+def stats():
+    if not enabled():
+        return {}
+    result = dict(last)
+    result.update(counters)
+    return {'Memory': result}
@@ -16,16 +16,73 @@
 #  permissions and limitations under the License.                            #
 ##############################################################################
 
+from __future__ import print_function
 import datetime
 import json
 import logging
 import os
+import time
 import timeit
 from urllib2 import Request
 from urllib2 import urlopen
 from setuptools import setup, find_packages
 from pkg_resources import get_distribution
-from thumbor.url import Url
+from image_handler import lambda_cache
+from image_handler import lambda_memory
+from image_handler import lambda_operations
+from image_handler import lambda_overlay
+from image_handler import lambda_s3
+
+namespace = 'ServerlessImageHandler'
+
+
+def log_enabled():
+    return str(os.environ.get('METRICS_LOG_ENABLED')).upper() == 'YES'
+
+
+def container_stats():
+    data = {}
+    for stats in (lambda_cache.stats(), lambda_s3.stats(),
+                  lambda_memory.stats(), lambda_operations.stats(),
+                  lambda_overlay.stats()):
+        data.update(stats)
+    return data
+
+
+def flatten(data, prefix=''):
+    '''Numeric leaves of nested stats as {'Tier.Counter': value}.'''
+    values = {}
+    for name, value in data.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + name + '.'))
+        elif isinstance(value, (int, long, float)) and\
+                not isinstance(value, bool):
+            values[prefix + name] = value
+    return values
+
+
+def log_data(result, start_time):
+    '''Writes the container's cache, S3 and memory counters to the
+    function log as a CloudWatch embedded metric format record, so they
+    land in the operator's own account.'''
+    values = flatten(container_stats())
+    values['ResponseTime'] = round(timeit.default_timer() - start_time, 3)
+    record = dict(values)
+    record['FunctionName'] = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    record['StatusCode'] = str(result['statusCode'])
+    degraded = result.get('headers', {}).get('X-Image-Handler-Degraded')
+    if degraded:
+        record['Degradations'] = degraded.split(',')
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': namespace,
+            'Dimensions': [['FunctionName']],
+            'Metrics': [{'Name': name} for name in sorted(values)]
+        }]
+    }
+    print(json.dumps(record, sort_keys=True))
+    return record
 
 
 def send_data(event, result, start_time):
@@ -33,8 +90,7 @@ def send_data(event, result, start_time):
     time_stamp = str(time_now)
     postDict = {}
     size = '-'
-    filters = Url.parse_decrypted(event['path'])
-    del filters['image']
+    filters = lambda_operations.parse(event['path']).options or {}
     if int(result['statusCode']) == 200:
         size = (len(result['body'] * 3)) / 4
     postDict['Data'] = {
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Request paths parsed once per container: the rewritten path and the
+Thumbor options it asks for, memoized per distinct API Gateway path so a
+repeated catalog URL costs a dictionary lookup instead of the rewrite
+patterns and Thumbor's URL regex.
+
+OPERATIONS_CACHE_SIZE bounds the number of paths kept (0 turns it off).'''
+
+import os
+import re
+from thumbor.url import Url
+from image_handler import lambda_cache
+from image_handler import lambda_rewrite
+
+operations = None
+
+
+class Operations(object):
+    '''A parsed request path. Instances are shared by every request for
+    the same path, so callers copy values before changing them.'''
+
+    __slots__ = ('path', 'values', 'options')
+
+    def __init__(self, path, values):
+        self.path = path
+        self.values = values
+        self.options = None
+        if values:
+            self.options = dict(values)
+            del self.options['image']
+
+
+def max_entries():
+    return int(os.environ.get('OPERATIONS_CACHE_SIZE') or 4096)
+
+
+def get_operations():
+    global operations
+    if operations is None:
+        operations = lambda_cache.register(
+            lambda_cache.LRUCache(max_entries()))
+    return operations
+
+
+def rewrite_patterns():
+    if str(os.environ.get('REWRITE_ENABLED')).upper() == 'YES':
+        return os.environ.get('REWRITE_PATTERNS')
+    return None
+
+
+def parse_values(http_path):
+    '''Thumbor's options for http_path, None when it names no image.'''
+    if http_path.startswith('/unsafe/'):
+        http_path = http_path[len('/unsafe'):]
+    values = Url.parse_decrypted(http_path)
+    if not values or not values['image']:
+        return None
+    return values
+
+
+def parse(path, rewrite=True):
+    '''Operations for a request path, after the REWRITE_PATTERNS rules
+    unless rewrite is False.'''
+    patterns = rewrite_patterns() if rewrite else None
+    key = (path, patterns)
+    cached = max_entries() and get_operations().get(key)
+    if cached:
+        return cached
+    http_path = path
+    if patterns is not None:
+        http_path = lambda_rewrite.match_patterns(path)
+    parsed = Operations(http_path, parse_values(http_path))
+    if max_entries():
+        get_operations().put(key, parsed)
+    return parsed
+
+
+def with_quality(filters, quality):
+    existing = re.sub(r'quality\([^)]*\):?', '', filters or '').rstrip(':')
+    quality = 'quality(%d)' % quality
+    if existing:
+        return existing + ':' + quality
+    return quality
+
+
+def build_path(values):
+    trim = values['trim']
+    if trim == 'trim':
+        trim = True
+    elif trim:
+        trim = trim[len('trim:'):]
+    options = Url.generate_options(
+        debug=values['debug'],
+        width=values['width'],
+        height=values['height'],
+        smart=values['smart'],
+        meta=values['meta'],
+        trim=trim,
+        adaptive=values['adaptive'],
+        full=values['full'],
+        fit_in=values['fit_in'],
+        horizontal_flip=values['horizontal_flip'],
+        vertical_flip=values['vertical_flip'],
+        halign=values['halign'],
+        valign=values['valign'],
+        crop_left=values['crop']['left'],
+        crop_top=values['crop']['top'],
+        crop_right=values['crop']['right'],
+        crop_bottom=values['crop']['bottom'],
+        filters=values['filters']
+    )
+    if options:
+        return '/%s/%s' % (options, values['image'])
+    return '/' + values['image']
+
+
+def derive(operations, values):
+    '''Operations for the same image with changed values, keeping the
+    /unsafe prefix of the original path.'''
+    prefix = '/unsafe' if operations.path.startswith('/unsafe/') else ''
+    return Operations(prefix + build_path(values), values)
+
+
+def stats():
+    if operations is None:
+        return {}
+    return {'OperationsCache': operations.stats()}
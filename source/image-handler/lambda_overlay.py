@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Decoded overlay assets for the lambda_watermark and lambda_frame
+filters, kept in process memory so a watermark is fetched and decoded once
+per container rather than once per request.
+
+Entries hold RGBA pixels keyed by (url, ETag, size, alpha): the decoded
+source, the source blended at a watermark alpha, and that blend scaled to
+a target size. The ETag comes from the source ETag cache, so a replaced
+asset is picked up within SOURCE_ETAG_TTL. OVERLAY_CACHE_BYTES bounds the
+cache (0 turns it off) and OVERLAY_PRELOAD lists comma-separated assets
+to decode when Thumbor starts.'''
+
+import logging
+import os
+import threading
+from image_handler import lambda_cache
+from image_handler import lambda_result_storage
+
+assets = None
+
+
+def max_bytes():
+    return int(os.environ.get('OVERLAY_CACHE_BYTES') or 32 * 1024 * 1024)
+
+
+def get_assets():
+    global assets
+    if assets is None:
+        assets = lambda_cache.register(
+            lambda_cache.MemoryTier(max_bytes()))
+    return assets
+
+
+def asset_key(config, url, size=None, alpha=None):
+    '''None when the asset cannot be validated, which is the case for
+    overlays loaded over HTTP.'''
+    if not max_bytes() or url.startswith('http'):
+        return None
+    etag = lambda_result_storage.source_etag(config, url)
+    if etag is None:
+        return None
+    return (url, etag, size and tuple(int(side) for side in size), alpha)
+
+
+def load(key, engine):
+    '''Puts the cached pixels for key into engine. False on a miss.'''
+    if key is None:
+        return False
+    entry = get_assets().get(key)
+    if entry is None:
+        return False
+    engine.image = engine.gen_image(entry['size'], 'transparent')
+    engine.set_image_data(entry['body'])
+    return True
+
+
+def store(key, engine):
+    if key is None:
+        return
+    engine.enable_alpha()
+    mode, data = engine.image_data_as_rgb()
+    if len(data) > get_assets().max_bytes:
+        return
+    get_assets().put(key, {'body': data, 'size': tuple(engine.size)})
+
+
+def preload(context):
+    for url in (os.environ.get('OVERLAY_PRELOAD') or '').split(','):
+        url = url.strip()
+        key = url and asset_key(context.config, url)
+        if not key:
+            continue
+        data = lambda_result_storage.fetch_source(context.config, url)
+        if data is None:
+            logging.error('overlay preload error: %s not found' % (url))
+            continue
+        try:
+            engine = context.modules.engine.__class__(context)
+            engine.load(data, None)
+            store(key, engine)
+        except Exception as error:
+            logging.error('overlay preload error: %s' % (error))
+
+
+def preload_in_background(context):
+    t = threading.Thread(target=preload, args=(context, ))
+    t.daemon = True
+    t.start()
+    return t
+
+
+def stats():
+    if assets is None:
+        return {}
+    return {'OverlayCache': assets.stats()}
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import logging
+import os
+import subprocess
+from thumbor.engines import BaseEngine
+
+passthrough_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+
+
+def enabled():
+    return str(os.environ.get('PASSTHROUGH_ENABLED')).upper() == 'YES'
+
+
+def max_bytes():
+    return int(os.environ.get('PASSTHROUGH_MAX_BYTES') or 4 * 1024 * 1024)
+
+
+def optimizing():
+    return str(os.environ.get('PASSTHROUGH_OPTIMIZE')).upper() == 'YES'
+
+
+def is_noop(values, config):
+    '''True when the parsed Thumbor options would hand back the source
+    pixels unchanged, so decoding and re-encoding can be skipped.'''
+    if values['debug'] or values['meta'] or values['trim']:
+        return False
+    if any(values['crop'].values()):
+        return False
+    if values['width'] not in (0, 'orig') or\
+       values['height'] not in (0, 'orig'):
+        return False
+    if values['horizontal_flip'] or values['vertical_flip']:
+        return False
+    if values['filters']:
+        return False
+    if config.get('MAX_WIDTH', 0) or config.get('MAX_HEIGHT', 0):
+        return False
+    return True
+
+
+def content_type(body):
+    mimetype = BaseEngine.get_mimetype(body)
+    if mimetype not in passthrough_types:
+        return None
+    return mimetype
+
+
+def optimize(config, mimetype, body):
+    '''Runs jpegtran losslessly over JPEG sources when it is available.
+    Metadata is dropped unless PRESERVE_EXIF_INFO is set, as Thumbor would.'''
+    if mimetype != 'image/jpeg' or not optimizing():
+        return body
+    jpegtran = config.get('JPEGTRAN_PATH')
+    if not jpegtran or not os.path.exists(jpegtran):
+        return body
+    copy = 'all' if config.get('PRESERVE_EXIF_INFO', False) else 'none'
+    try:
+        process = subprocess.Popen(
+            [jpegtran, '-copy', copy, '-optimize', '-progressive'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        optimized, error = process.communicate(body)
+    except OSError as error:
+        logging.error('passthrough optimize error: %s' % (error))
+        return body
+    if process.returncode != 0 or not optimized:
+        logging.error('passthrough optimize error: %s' % (error))
+        return body
+    return optimized
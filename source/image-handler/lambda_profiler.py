@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Sampling profiler for single invocations. Every PROFILE_INTERVAL_MS it
+records the stack of each thread (the handler and the Thumbor IOLoop) and
+writes them in collapsed form, one "frame;frame;frame count" line per
+distinct stack, ready for flamegraph.pl or speedscope.
+
+A request is profiled when PROFILE_ENABLED=Yes, or when it carries
+X-Image-Handler-Profile set to the HMAC of its path under PROFILE_SECRET,
+
+    hmac.new(PROFILE_SECRET, path, hashlib.sha256).hexdigest()
+
+The response names the profile in the same header.
+'''
+
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from image_handler import lambda_result_storage
+
+header = 'X-Image-Handler-Profile'
+
+
+def signature(secret, path):
+    return hmac.new(secret, path, hashlib.sha256).hexdigest()
+
+
+def requested(event):
+    if str(os.environ.get('PROFILE_ENABLED')).upper() == 'YES':
+        return True
+    secret = os.environ.get('PROFILE_SECRET')
+    if not secret:
+        return False
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == header.lower():
+            return hmac.compare_digest(
+                str(value), signature(secret, str(event.get('path', ''))))
+    return False
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+class Sampler(object):
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    def sample(self):
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        own = threading.current_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, 'thread-%d' % ident))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        while self.running:
+            self.sample()
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='profiler')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        return self
+
+    def collapsed(self):
+        return ''.join('%s %d\n' % (stack, count)
+                       for stack, count in sorted(self.stacks.items()))
+
+
+def prune(root, keep):
+    '''Removes all but the keep most recent profiles under root.'''
+    paths = [os.path.join(root, name) for name in os.listdir(root)
+             if name.endswith('.collapsed')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+
+
+def upload(config, name, data):
+    if config is None or not config.get('TC_AWS_STORAGE_BUCKET'):
+        logging.error('profile upload error: no TC_AWS_STORAGE_BUCKET '
+                      'configured, %s kept locally only' % (name))
+        return
+    key = '/'.join([config.get('TC_AWS_STORAGE_ROOT_PATH', ''),
+                    os.environ.get('PROFILE_S3_ROOT_PATH') or
+                    'thumbor/profiles', name])
+    try:
+        lambda_result_storage.s3_client(config).put_object(
+            Bucket=config.get('TC_AWS_STORAGE_BUCKET'),
+            Key=lambda_result_storage.clean_key(key),
+            Body=data, ContentType='text/plain')
+    except Exception as error:
+        logging.error('profile upload error: %s' % (error))
+
+
+def start(event):
+    if not requested(event):
+        return None
+    interval = int(os.environ.get('PROFILE_INTERVAL_MS') or 5) / 1000.0
+    return Sampler(interval).start()
+
+
+def finish(sampler, event, config=None):
+    '''Stops sampling and writes the collapsed stacks under PROFILE_PATH,
+    keeping the PROFILE_MAX_FILES most recent, and to TC_AWS_STORAGE_BUCKET
+    when PROFILE_S3_ENABLED=Yes. Returns the name of the profile.'''
+    sampler.stop()
+    request_id = (event.get('requestContext') or {}).get('requestId') or\
+        str(uuid.uuid4())
+    name = '%s.collapsed' % request_id
+    data = sampler.collapsed()
+    root = os.environ.get('PROFILE_PATH') or '/tmp/profiles'
+    try:
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        with open(os.path.join(root, name), 'w') as profile:
+            profile.write(data)
+        prune(root, int(os.environ.get('PROFILE_MAX_FILES') or 20))
+    except (IOError, OSError) as error:
+        logging.error('profile write error: %s' % (error))
+    if str(os.environ.get('PROFILE_S3_ENABLED')).upper() == 'YES':
+        upload(config, name, data)
+    logging.info('profile %s: %d samples of %s',
+                 name, sampler.samples, event.get('path'))
+    return name
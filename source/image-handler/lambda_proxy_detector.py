@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import logging
+from PIL import Image
+from thumbor.detectors import BaseDetector
+from thumbor.point import FocalPoint
+
+
+class ProxyEngine(object):
+    '''Stands in for the Thumbor engine while detectors run, exposing only
+    what they read: the size and a grayscale image.'''
+
+    def __init__(self, image, extension=None):
+        self.image = image
+        self.size = image.size
+        self.extension = extension
+
+    def convert_to_grayscale(self, update_image=True, with_alpha=True):
+        return self.image
+
+
+class ProxyModules(object):
+
+    def __init__(self, modules, engine):
+        self.engine = engine
+        self.storage = getattr(modules, 'storage', None)
+        self.importer = getattr(modules, 'importer', None)
+
+
+class ProxyRequest(object):
+
+    def __init__(self):
+        self.focal_points = []
+
+
+class ProxyContext(object):
+
+    def __init__(self, context, engine):
+        self.config = context.config
+        self.modules = ProxyModules(context.modules, engine)
+        self.request = ProxyRequest()
+        self.request_handler = getattr(context, 'request_handler', None)
+
+
+def build_proxy(image, max_size):
+    '''Returns a grayscale copy of image whose longest side is at most
+    max_size, and the factor that maps proxy coordinates back.'''
+    width, height = image.size
+    scale = max(width, height) / float(max_size)
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGB')
+    if scale > 1:
+        size = (max(1, int(round(width / scale))),
+                max(1, int(round(height / scale))))
+        image = image.resize(size, Image.BILINEAR)
+    else:
+        scale = 1.0
+    return image.convert('L'), scale
+
+
+def rescale(point, scale):
+    return FocalPoint(
+        point.x * scale,
+        point.y * scale,
+        height=point.height * scale,
+        width=point.width * scale,
+        weight=point.weight * scale * scale,
+        origin=point.origin
+    )
+
+
+class Detector(BaseDetector):
+    '''Runs every detector listed after this one against a bounded-size
+    grayscale proxy of the source, then maps the focal points back to
+    source coordinates. List it first in DETECTORS.'''
+
+    def detect(self, callback):
+        engine = self.context.modules.engine
+        followers = self.detectors[self.index + 1:]
+        if not followers:
+            callback()
+            return
+        try:
+            proxy, scale = build_proxy(
+                engine.image,
+                self.context.config.get('DETECTOR_PROXY_MAX_SIZE', 600)
+            )
+        except Exception as error:
+            logging.error('proxy detector error: %s' % (error))
+            self.next(callback)
+            return
+        proxy_context = ProxyContext(
+            self.context,
+            ProxyEngine(proxy, getattr(engine, 'extension', None))
+        )
+
+        def after_detection():
+            for point in proxy_context.request.focal_points:
+                self.context.request.focal_points.append(rescale(point, scale))
+            callback()
+
+        followers[0](proxy_context, 0, followers).detect(after_detection)
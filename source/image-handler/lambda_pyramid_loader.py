@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Thumbor loader that serves reduced-scale copies of an original (a
+pyramid of 1/2, 1/4, 1/8 ... levels kept in the storage bucket) whenever
+the smallest one still covers the requested output size, and loads the
+original otherwise. Originals are read like tc_aws.loaders.s3_loader does,
+but through the process-wide pooled client of lambda_result_storage with
+lambda_s3's retries and hedging.
+
+Levels can be built on first access or ahead of time with
+
+    python lambda_pyramid_loader.py thumbor.conf key [key ...]
+'''
+
+from __future__ import print_function
+import json
+import logging
+import re
+import sys
+import threading
+import urllib2
+from io import BytesIO
+from PIL import Image
+from botocore.exceptions import ClientError
+from tornado.concurrent import return_future
+from thumbor.loaders import LoaderResult
+from tc_aws.loaders import s3_loader
+from image_handler import lambda_cache
+from image_handler import lambda_result_storage
+from image_handler import lambda_s3
+
+formats = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+# filters whose arguments are coordinates in the original image
+source_filters = re.compile(r'(^|:)focal\(')
+manifests = lambda_cache.register(
+    lambda_cache.TTLCache(max_entries=4096, ttl=60 * 60))
+
+
+def enabled(config):
+    return bool(config.get('PYRAMID_ENABLED', False)) and\
+        bool(config.get('TC_AWS_STORAGE_BUCKET'))
+
+
+def location(config, url, name):
+    key = '/'.join([
+        config.get('TC_AWS_STORAGE_ROOT_PATH', ''),
+        config.get('PYRAMID_ROOT_PATH', 'thumbor/pyramid'),
+        urllib2.unquote(url),
+        name
+    ])
+    return config.get('TC_AWS_STORAGE_BUCKET'),\
+        lambda_result_storage.clean_key(key)
+
+
+def get_object(config, url, name):
+    bucket, key = location(config, url, name)
+    try:
+        response = lambda_s3.get_object(
+            lambda_result_storage.s3_client(config), config, bucket, key)
+    except ClientError as error:
+        if not lambda_result_storage.not_found(error):
+            logging.error('pyramid read error: %s' % (error))
+        return None
+    except Exception as error:
+        logging.error('pyramid read error: %s' % (error))
+        return None
+    return response['Body']
+
+
+def put_object(config, url, name, body, content_type):
+    bucket, key = location(config, url, name)
+    lambda_result_storage.s3_client(config).put_object(
+        Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+
+
+def get_manifest(config, url):
+    etag = lambda_result_storage.source_etag(config, url)
+    if etag is None:
+        return None
+    manifest = manifests.get(url)
+    if manifest is None:
+        try:
+            manifest = json.loads(get_object(config, url, 'manifest.json') or
+                                  'null')
+        except ValueError:
+            manifest = None
+        if manifest is None:
+            return None
+        manifests.put(url, manifest)
+    if manifest.get('etag') != etag:
+        return None
+    return manifest
+
+
+def choose_level(manifest, request):
+    '''Largest reduction factor whose level still covers every requested
+    dimension; 1 means the original is needed.'''
+    width, height = request.width, request.height
+    if not isinstance(width, int) or not isinstance(height, int):
+        return 1
+    if not width and not height:
+        return 1
+    crop = getattr(request, 'crop', None) or {}
+    if any(crop.get(side) for side in ('left', 'top', 'right', 'bottom')):
+        return 1
+    if getattr(request, 'meta', False):
+        return 1
+    if source_filters.search(getattr(request, 'filters', None) or ''):
+        return 1
+    chosen = 1
+    for level in sorted(manifest['levels']):
+        level_width = manifest['width'] / level
+        level_height = manifest['height'] / level
+        if level_width >= width and level_height >= height:
+            chosen = level
+    return chosen
+
+
+def build_levels(config, url, image):
+    width, height = image.size
+    exif = image.info.get('exif')
+    levels = []
+    for level in config.get('PYRAMID_LEVELS', [2, 4, 8]):
+        size = (width / level, height / level)
+        if min(size) < config.get('PYRAMID_MIN_SIZE', 64):
+            break
+        reduced = image.resize(size, Image.ANTIALIAS)
+        buffer = BytesIO()
+        options = {}
+        if image.format == 'JPEG':
+            options['quality'] = 95
+            if exif:
+                options['exif'] = exif
+        reduced.save(buffer, image.format, **options)
+        put_object(config, url, str(level), buffer.getvalue(),
+                   formats[image.format])
+        levels.append(level)
+    return levels
+
+
+def build(config, url, data):
+    '''Stores the reduced levels of data and the manifest describing them.
+    Sources that cannot be reduced (GIF, animated, unknown formats) get a
+    manifest without levels so they are not built again.'''
+    etag = lambda_result_storage.source_etag(config, url)
+    if etag is None:
+        return None
+    try:
+        image = Image.open(BytesIO(data))
+    except IOError:
+        image = None
+    width, height = image.size if image is not None else (0, 0)
+    levels = []
+    if image is not None and image.format in formats and\
+       not getattr(image, 'is_animated', False):
+        levels = build_levels(config, url, image)
+    manifest = {'etag': etag, 'width': width, 'height': height,
+                'levels': levels}
+    put_object(config, url, 'manifest.json', json.dumps(manifest),
+               'application/json')
+    manifests.put(url, manifest)
+    return manifest
+
+
+def build_in_background(config, url, data):
+    def run():
+        try:
+            build(config, url, data)
+        except Exception as error:
+            logging.error('pyramid build error: %s' % (error))
+    t = threading.Thread(target=run)
+    t.daemon = True
+    t.start()
+    return t
+
+
+def load_source(context, url, callback):
+    handed_off = lambda_result_storage.take_source(context.config, url)
+    if handed_off is not None:
+        callback(handed_off)
+        return
+    bucket, key = s3_loader._get_bucket_and_key(context, url)
+    if not s3_loader._validate_bucket(context, bucket):
+        callback(LoaderResult(successful=False,
+                              error=LoaderResult.ERROR_NOT_FOUND))
+        return
+    try:
+        response = lambda_s3.get_object(
+            lambda_result_storage.s3_client(context.config), context.config,
+            bucket, lambda_result_storage.clean_key(key))
+    except ClientError as error:
+        missing = lambda_result_storage.not_found(error)
+        if not missing:
+            logging.error('loader error: %s' % (error))
+        callback(LoaderResult(successful=False, error=(
+            LoaderResult.ERROR_NOT_FOUND if missing
+            else LoaderResult.ERROR_UPSTREAM)))
+        return
+    except Exception as error:
+        logging.error('loader error: %s' % (error))
+        callback(LoaderResult(successful=False,
+                              error=LoaderResult.ERROR_UPSTREAM))
+        return
+    callback(response['Body'])
+
+
+@return_future
+def load(context, url, callback):
+    config = context.config
+    if s3_loader._use_http_loader(context, url):
+        s3_loader.load(context, url, callback=callback)
+        return
+    # overlays and other secondary images come through the loader too;
+    # levels are sized for the requested image only
+    if not enabled(config) or\
+       url != getattr(context.request, 'image_url', None):
+        load_source(context, url, callback)
+        return
+    manifest = get_manifest(config, url)
+    if manifest is not None:
+        level = choose_level(manifest, context.request)
+        if level > 1:
+            data = get_object(config, url, str(level))
+            if data is not None:
+                lambda_result_storage.take_source(config, url)
+                context.request.pyramid_level = level
+                callback(data)
+                return
+
+    def after_load(result):
+        if manifest is None and isinstance(result, str) and\
+           config.get('PYRAMID_BUILD_ON_ACCESS', True):
+            build_in_background(config, url, result)
+        callback(result)
+
+    load_source(context, url, after_load)
+
+
+def main(arguments):
+    from thumbor.config import Config
+    config = Config.load(arguments[0])
+    config.allow_environment_variables()
+    for url in arguments[1:]:
+        data = lambda_result_storage.fetch_source(config, url)
+        if data is None:
+            print('%s: not found' % url)
+            continue
+        manifest = build(config, url, data)
+        print('%s: %s' % (url, manifest and manifest['levels']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import urllib2
+from botocore.exceptions import ClientError
+from tc_aws.loaders import s3_loader
+from thumbor.context import Context
+from image_handler import lambda_cache
+from image_handler import lambda_s3
+
+client = None
+source_etags = lambda_cache.register(lambda_cache.TTLCache(
+    max_entries=4096,
+    ttl=int(os.environ.get('SOURCE_ETAG_TTL') or 60)
+))
+handoffs = lambda_cache.register(
+    lambda_cache.TTLCache(max_entries=8, ttl=30))
+
+
+class S3Tier(lambda_cache.CacheTier):
+    '''Result bucket as the shared, cross-container cache tier.'''
+
+    name = 'S3'
+    shared = True
+
+    def __init__(self, config):
+        super(S3Tier, self).__init__()
+        self.config = config
+
+    def get(self, key):
+        return self.record(fetch(self.config, key))
+
+    def put(self, key, result):
+        '''Uploads on a daemon thread so a miss does not wait for the PUT.
+        On Lambda an upload still running when the invocation returns
+        finishes once the container is thawed.'''
+        t = threading.Thread(target=self.write, args=(key, result),
+                             name='result-storage')
+        t.daemon = True
+        t.start()
+        return t
+
+    def write(self, key, result):
+        try:
+            if store(self.config, key, result):
+                with self.lock:
+                    self.bytes_stored += len(result['body'])
+        except Exception as error:
+            logging.error('result_storage store error: %s' % (error))
+
+
+def enabled():
+    return str(os.environ.get('RESULT_CACHE_ENABLED')).upper() == 'YES'
+
+
+def redirect_mode():
+    return str(os.environ.get('RESULT_CACHE_MODE')).upper() == 'REDIRECT'
+
+
+def s3_client(config):
+    global client
+    if client is None:
+        client = lambda_s3.create_client(config)
+    return client
+
+
+def clean_key(key):
+    while '//' in key:
+        key = key.replace('//', '/')
+    return key.lstrip('/')
+
+
+def source_location(config, image):
+    '''Bucket and key the s3 loader reads image from.'''
+    bucket, key = s3_loader._get_bucket_and_key(Context(config=config),
+                                                image)
+    return bucket, clean_key(key)
+
+
+def source_allowed(config, image):
+    '''Whether TC_AWS_ALLOWED_BUCKETS lets the s3 loader read image.'''
+    bucket, key = source_location(config, image)
+    return s3_loader._validate_bucket(Context(config=config), bucket)
+
+
+def result_location(config, digest):
+    key = '/'.join([digest[:2], digest])
+    root_path = config.get('TC_AWS_RESULT_STORAGE_ROOT_PATH')
+    if root_path:
+        key = '/'.join([root_path, key])
+    return config.get('TC_AWS_RESULT_STORAGE_BUCKET'), clean_key(key)
+
+
+def not_found(error):
+    code = error.response.get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+def shared_tier(config):
+    if not config.get('TC_AWS_RESULT_STORAGE_BUCKET'):
+        return None
+    return S3Tier(config)
+
+
+def source_etag(config, image):
+    etag = source_etags.get(image)
+    if etag is not None:
+        return etag
+    response = head_source(config, image)
+    if response is None:
+        return None
+    return response.get('ETag')
+
+
+def hand_off_source(config, image, data):
+    '''Keeps a source the handler fetched for the loader of the render
+    that follows, so Thumbor does not download it again.'''
+    handoffs.put(source_location(config, image), data)
+
+
+def take_source(config, image):
+    return handoffs.pop(source_location(config, image))
+
+
+def fetch_source(config, image):
+    if not source_allowed(config, image):
+        return None
+    bucket, key = source_location(config, image)
+    try:
+        response = lambda_s3.get_object(s3_client(config), config,
+                                        bucket, key)
+    except ClientError as error:
+        if not not_found(error):
+            logging.error('fetch_source error: %s' % (error))
+        return None
+    except Exception as error:
+        logging.error('fetch_source error: %s' % (error))
+        return None
+    if response.get('ETag'):
+        source_etags.put(image, response['ETag'])
+    return response['Body']
+
+
+def result_key(etag, operations, output_format, quality):
+    '''Content address of a render: same source bytes and same operations
+    always map to the same key, whichever container computed it.'''
+    digest = hashlib.sha256()
+    digest.update(etag or '')
+    digest.update('\0')
+    digest.update(json.dumps(operations, sort_keys=True))
+    digest.update('\0')
+    digest.update(output_format or '')
+    digest.update('\0')
+    digest.update(str(quality))
+    return digest.hexdigest()
+
+
+def exists(config, digest):
+    bucket, key = result_location(config, digest)
+    try:
+        s3_client(config).head_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if not not_found(error):
+            logging.error('result_storage exists error: %s' % (error))
+        return False
+    return True
+
+
+def head(config, digest):
+    '''Metadata of a stored render, without its body.'''
+    bucket, key = result_location(config, digest)
+    try:
+        response = s3_client(config).head_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if not not_found(error):
+            logging.error('result_storage head error: %s' % (error))
+        return None
+    return {
+        'content_length': response.get('ContentLength'),
+        'content_type': response.get('ContentType'),
+        'cache_control': response.get('CacheControl'),
+        'etag': response.get('Metadata', {}).get('thumbor-etag', '')
+    }
+
+
+def head_source(config, image):
+    if not source_allowed(config, image):
+        return None
+    bucket, key = source_location(config, image)
+    try:
+        response = s3_client(config).head_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if not not_found(error):
+            logging.error('head_source error: %s' % (error))
+        return None
+    if response.get('ETag'):
+        source_etags.put(image, response['ETag'])
+    return response
+
+
+def fetch(config, digest):
+    bucket, key = result_location(config, digest)
+    try:
+        response = lambda_s3.get_object(s3_client(config), config,
+                                        bucket, key)
+    except ClientError as error:
+        if not not_found(error):
+            logging.error('result_storage fetch error: %s' % (error))
+        return None
+    except Exception as error:
+        logging.error('result_storage fetch error: %s' % (error))
+        return None
+    metadata = response.get('Metadata', {})
+    return {
+        'body': response['Body'],
+        'content_type': response.get('ContentType'),
+        'cache_control': response.get('CacheControl'),
+        'etag': metadata.get('thumbor-etag', '')
+    }
+
+
+def store(config, digest, result):
+    bucket, key = result_location(config, digest)
+    try:
+        s3_client(config).put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=result['body'],
+            ContentType=result['content_type'],
+            CacheControl=result['cache_control'],
+            Metadata={'thumbor-etag': result['etag']}
+        )
+    except ClientError as error:
+        logging.error('result_storage store error: %s' % (error))
+        return False
+    return True
+
+
+def presigned_url(config, digest, expiry=3600):
+    bucket, key = result_location(config, digest)
+    return s3_client(config).generate_presigned_url(
+        ClientMethod='get_object',
+        Params={'Bucket': bucket, 'Key': key},
+        ExpiresIn=expiry
+    )
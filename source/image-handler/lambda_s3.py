@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import Queue
+import collections
+import logging
+import random
+import threading
+import time
+import timeit
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from botocore.vendored.requests.adapters import HTTPAdapter
+from tc_aws.aws import session as session_handler
+
+# seconds taken by recent GETs, body included
+latencies = collections.deque(maxlen=256)
+counters = {'Gets': 0, 'Hedges': 0, 'HedgeWins': 0, 'Retries': 0}
+lock = threading.Lock()
+
+
+def create_client(config):
+    '''S3 client meant to live for the whole process: bounded connect and
+    read timeouts and a keep-alive pool sized by S3_MAX_CONNECTIONS, so
+    later requests reuse warm connections instead of new handshakes.
+    botocore's own retry handler still backs off on throttling, 5xx and
+    socket errors.'''
+    endpoint = config.get('TC_AWS_ENDPOINT') or None
+    session = session_handler.get_session(endpoint is not None)
+    client = session.create_client(
+        's3',
+        region_name=config.get('TC_AWS_REGION'),
+        endpoint_url=endpoint,
+        config=Config(
+            connect_timeout=config.get('S3_CONNECT_TIMEOUT', 2),
+            read_timeout=config.get('S3_READ_TIMEOUT', 5),
+            # a custom endpoint keeps the bucket in the path, whichever
+            # session tc_aws happened to create first
+            s3={'addressing_style': 'path'} if endpoint else None
+        )
+    )
+    size = config.get('S3_MAX_CONNECTIONS', 16)
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    for prefix in ('https://', 'http://'):
+        client._endpoint.http_session.mount(prefix, adapter)
+    return client
+
+
+def record(name, elapsed=None):
+    with lock:
+        counters[name] += 1
+        if elapsed is not None:
+            latencies.append(elapsed)
+
+
+def hedge_delay(config):
+    '''Seconds to wait on a GET before sending a second, identical one:
+    the S3_HEDGE_PERCENTILE of recent GET latencies, once enough have been
+    seen. None when hedging is off or there is no history yet.'''
+    if not config.get('S3_HEDGE_ENABLED', False):
+        return None
+    with lock:
+        samples = sorted(latencies)
+    if len(samples) < config.get('S3_HEDGE_MIN_SAMPLES', 20):
+        return None
+    index = int(len(samples) * config.get('S3_HEDGE_PERCENTILE', 95) / 100.0)
+    delay = samples[min(index, len(samples) - 1)]
+    return max(delay, config.get('S3_HEDGE_MIN_DELAY_MS', 50) / 1000.0)
+
+
+def timed_get(client, bucket, key):
+    start = timeit.default_timer()
+    response = client.get_object(Bucket=bucket, Key=key)
+    response['Body'] = response['Body'].read()
+    record('Gets', timeit.default_timer() - start)
+    return response
+
+
+def start(target, *args):
+    t = threading.Thread(target=target, args=args)
+    t.daemon = True
+    t.start()
+    return t
+
+
+def hedged_get(client, config, bucket, key):
+    delay = hedge_delay(config)
+    if delay is None:
+        return timed_get(client, bucket, key)
+    results = Queue.Queue()
+
+    def run(hedge):
+        try:
+            results.put((hedge, timed_get(client, bucket, key), None))
+        except Exception as error:
+            results.put((hedge, None, error))
+
+    start(run, False)
+    try:
+        outcomes = [results.get(timeout=delay)]
+    except Queue.Empty:
+        record('Hedges')
+        start(run, True)
+        outcomes = [results.get()]
+        # a request that failed in transit leaves the other one to answer
+        if outcomes[0][2] is not None and\
+           not isinstance(outcomes[0][2], ClientError):
+            outcomes.append(results.get())
+    for hedge, response, error in outcomes:
+        if error is None:
+            if hedge:
+                record('HedgeWins')
+            return response
+    raise outcomes[-1][2]
+
+
+def get_object(client, config, bucket, key):
+    '''GetObject with the body already read, retried TC_AWS_MAX_RETRY
+    times with jittered exponential backoff and hedged after a latency
+    percentile. ClientErrors (missing keys, denied access) are raised
+    straight away.'''
+    attempts = config.get('TC_AWS_MAX_RETRY', 0) + 1
+    backoff = config.get('S3_RETRY_BACKOFF_MS', 100) / 1000.0
+    for attempt in range(attempts):
+        try:
+            return hedged_get(client, config, bucket, key)
+        except ClientError:
+            raise
+        except Exception as error:
+            if attempt == attempts - 1:
+                raise
+            logging.error('s3 get error: %s' % (error))
+            record('Retries')
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def stats():
+    with lock:
+        samples = sorted(latencies)
+        data = dict(counters)
+    if samples:
+        data['P50Ms'] = int(samples[len(samples) / 2] * 1000)
+        data['P99Ms'] = int(samples[min(len(samples) * 99 / 100,
+                                        len(samples) - 1)] * 1000)
+    return {'S3': data}
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Serves the image handler over plain HTTP for container or instance
+deployments behind a load balancer:
+
+    python -m image_handler.lambda_server
+
+Every request is turned into the API Gateway event lambda_handler expects
+and answered by it, so rewriting, unsafe URLs, WebP negotiation, caching
+and response building behave exactly as on Lambda. SERVER_WORKERS
+processes (one per CPU by default) are forked from a supervisor that
+restarts them if they die; each runs its own Thumbor on its own unix
+socket and handles one request at a time, closing the connection after
+each response. Workers share the listening
+socket, or bind their own with SO_REUSEPORT when SERVER_REUSE_PORT=Yes,
+and share the RESULT_CACHE_DISK_PATH result cache directory.
+
+Settings: SERVER_PORT (8080), SERVER_WORKERS, SERVER_REUSE_PORT,
+SERVER_REQUEST_TIMEOUT_MS (deadline seen by the degrade stages),
+SERVER_MEMORY_LIMIT_MB (limit seen by the memory governor) and
+THUMBOR_CONFIG_PATH (thumbor.conf next to this module).
+'''
+
+import BaseHTTPServer
+import base64
+import logging
+import os
+import socket
+import timeit
+import urllib
+import urlparse
+import uuid
+from tornado import process
+from image_handler import lambda_function
+
+# not exposed by the socket module on Python 2
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+
+class ServerContext(object):
+    '''Stands in for the Lambda context object.'''
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = 'image-handler'
+        self.memory_limit_in_mb = os.environ.get('SERVER_MEMORY_LIMIT_MB')
+        self.deadline = timeit.default_timer() + int(
+            os.environ.get('SERVER_REQUEST_TIMEOUT_MS') or 10000) / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - timeit.default_timer()) * 1000))
+
+
+def header_dict(message):
+    '''Request headers with their names as sent; mimetools lowercases them
+    but the handler looks them up as API Gateway passes them.'''
+    headers = {}
+    name = None
+    for line in message.headers:
+        if line[:1] in (' ', '\t') and name is not None:
+            headers[name] += ' ' + line.strip()
+            continue
+        name, _, value = line.partition(':')
+        name = name.strip()
+        headers[name] = value.strip()
+    return headers
+
+
+def build_event(method, raw_path, headers):
+    path, _, query = raw_path.partition('?')
+    parameters = dict((name, values[-1]) for name, values in
+                      urlparse.parse_qs(query).items())
+    return {
+        'resource': '/{proxy+}',
+        'path': path,
+        'httpMethod': method,
+        'headers': headers or None,
+        'queryStringParameters': parameters or None,
+        'pathParameters': {'proxy': path.lstrip('/')},
+        'requestContext': {
+            'httpMethod': method,
+            'requestId': str(uuid.uuid4()),
+            'resourcePath': '/{proxy+}'
+        },
+        'body': None,
+        'isBase64Encoded': False
+    }
+
+
+def response_body(response):
+    body = response.get('body') or ''
+    if str(response.get('isBase64Encoded')).lower() == 'true':
+        return base64.b64decode(body)
+    if isinstance(body, unicode):
+        return body.encode('utf-8')
+    return body
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # request bodies are read and dropped up to this size
+    max_body = 64 * 1024
+
+    def do_GET(self):
+        self.drain_body()
+        if self.path == '/healthcheck':
+            self.healthcheck()
+            return
+        response = lambda_function.lambda_handler(
+            build_event(self.command, self.path, header_dict(self.headers)),
+            ServerContext()
+        )
+        self.write(response)
+
+    do_HEAD = do_GET
+    do_POST = do_GET
+    do_PUT = do_GET
+    do_DELETE = do_GET
+    do_PATCH = do_GET
+    do_OPTIONS = do_GET
+
+    def drain_body(self):
+        length = self.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) <= self.max_body:
+            self.rfile.read(int(length))
+
+    def healthcheck(self):
+        thumbor_down, session = lambda_function.is_thumbor_down()
+        if thumbor_down:
+            self.write(thumbor_down)
+            return
+        self.write({'statusCode': 200, 'body': 'WORKING',
+                    'headers': {'Content-Type': 'text/plain'}})
+
+    def write(self, response):
+        body = response_body(response)
+        headers = response.get('headers') or {}
+        status = int(response['statusCode'])
+        self.log_request(status)
+        # send_response would add a second Date to rendered images
+        self.wfile.write('%s %d %s\r\n' % (
+            self.protocol_version, status,
+            self.responses.get(status, ('',))[0]))
+        if not headers.get('Date'):
+            self.send_header('Date', self.date_time_string())
+        for name, value in headers.items():
+            if value is not None and value != '':
+                self.send_header(name, value)
+        if 'Content-Length' not in headers:
+            self.send_header('Content-Length', str(len(body)))
+        # a worker serves one connection at a time, so an idle keep-alive
+        # client would hold it while other connections wait
+        self.send_header('Connection', 'close')
+        self.close_connection = 1
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info('%s %s' % (self.address_string(), format % args))
+
+
+class Server(BaseHTTPServer.HTTPServer):
+
+    allow_reuse_address = True
+    reuse_port = False
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        BaseHTTPServer.HTTPServer.server_bind(self)
+
+
+def make_server(port, reuse_port=False):
+    server = Server(('', port), Handler, bind_and_activate=False)
+    server.reuse_port = reuse_port
+    server.server_bind()
+    server.server_activate()
+    return server
+
+
+def use_socket(task_id):
+    '''Gives this worker its own Thumbor socket.'''
+    path = '/tmp/thumbor-%d' % task_id
+    lambda_function.thumbor_socket = path
+    lambda_function.unix_path = 'http+unix://' + urllib.quote(path, safe='')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def start_worker(task_id):
+    '''Starts this worker's Thumbor ahead of the first request.'''
+    use_socket(task_id)
+    lambda_function.start_server()
+
+
+def main():
+    lambda_function.log_level = str(os.environ.get('LOG_LEVEL') or
+                                    'ERROR').upper()
+    logging.getLogger().setLevel(lambda_function.log_level)
+    lambda_function.thumbor_config_path = os.environ.get(
+        'THUMBOR_CONFIG_PATH') or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'thumbor.conf')
+    port = int(os.environ.get('SERVER_PORT') or 8080)
+    workers = int(os.environ.get('SERVER_WORKERS') or 0) or None
+    reuse_port = str(os.environ.get('SERVER_REUSE_PORT')).upper() == 'YES'
+    if reuse_port:
+        task_id = process.fork_processes(workers)
+        server = make_server(port, reuse_port=True)
+    else:
+        server = make_server(port)
+        task_id = process.fork_processes(workers)
+    start_worker(task_id)
+    logging.info('worker %d serving on port %d' % (task_id, port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the 'License'). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the 'license' file accompanying this file. This file is distributed #
+#  on an 'AS IS' BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''thumbor.filters.watermark with the overlay taken from lambda_overlay:
+the blended and scaled watermark is reused across requests instead of
+being fetched, decoded, blended and resized each time.'''
+
+import math
+import tornado.web
+from thumbor.ext.filters import _alpha
+from thumbor.filters import BaseFilter, filter_method
+from thumbor.filters import watermark
+from thumbor.loaders import LoaderResult
+from thumbor.utils import logger
+from image_handler import lambda_overlay
+
+
+class Filter(watermark.Filter):
+
+    @filter_method(
+        BaseFilter.String,
+        r'(?:-?\d+p?)|center|repeat',
+        r'(?:-?\d+p?)|center|repeat',
+        BaseFilter.PositiveNumber,
+        r'(?:-?\d+)|none',
+        r'(?:-?\d+)|none',
+        async=True
+    )
+    def watermark(self, callback, url, x, y, alpha, w_ratio=False,
+                  h_ratio=False):
+        self.url = url
+        self.x = x
+        self.y = y
+        self.alpha = alpha
+        self.w_ratio = float(w_ratio) / 100.0\
+            if w_ratio and w_ratio != 'none' else False
+        self.h_ratio = float(h_ratio) / 100.0\
+            if h_ratio and h_ratio != 'none' else False
+        self.callback = callback
+        self.watermark_engine = self.context.modules.engine.__class__(
+            self.context)
+        try:
+            source_key = lambda_overlay.asset_key(self.context.config, url)
+            if lambda_overlay.load(self.blend_key(), self.watermark_engine):
+                self.on_blended()
+            elif lambda_overlay.load(source_key, self.watermark_engine):
+                self.on_decoded()
+            else:
+                self.context.modules.loader.load(self.context, self.url,
+                                                 self.on_fetch_done)
+        except tornado.web.HTTPError:
+            raise
+        except Exception as e:
+            logger.exception(e)
+            logger.warn('bad watermark')
+            raise tornado.web.HTTPError(500)
+
+    def blend_key(self, size=None):
+        return lambda_overlay.asset_key(self.context.config, self.url,
+                                        size, self.alpha)
+
+    def on_fetch_done(self, result):
+        if isinstance(result, LoaderResult) and not result.successful:
+            logger.warn(
+                'bad watermark result error=%s metadata=%s' %
+                (result.error, result.metadata)
+            )
+            raise tornado.web.HTTPError(400)
+        if isinstance(result, LoaderResult):
+            buffer = result.buffer
+        else:
+            buffer = result
+        self.on_image_ready(buffer)
+
+    def on_image_ready(self, buffer):
+        self.watermark_engine.load(buffer, None)
+        self.watermark_engine.enable_alpha()
+        lambda_overlay.store(
+            lambda_overlay.asset_key(self.context.config, self.url),
+            self.watermark_engine)
+        self.on_decoded()
+
+    def on_decoded(self):
+        mode, data = self.watermark_engine.image_data_as_rgb()
+        self.watermark_engine.set_image_data(
+            _alpha.apply(mode, self.alpha, data))
+        lambda_overlay.store(self.blend_key(), self.watermark_engine)
+        self.on_blended()
+
+    def on_blended(self):
+        sz = self.engine.size
+        watermark_sz = self.watermark_engine.size
+        if self.w_ratio or self.h_ratio:
+            watermark_sz = self.calc_watermark_size(
+                sz, watermark_sz, self.w_ratio, self.h_ratio)
+            scaled_key = self.blend_key(watermark_sz)
+            if not lambda_overlay.load(scaled_key, self.watermark_engine):
+                self.watermark_engine.resize(watermark_sz[0], watermark_sz[1])
+                lambda_overlay.store(scaled_key, self.watermark_engine)
+        self.place(sz, watermark_sz)
+
+    def place(self, sz, watermark_sz):
+        '''Pastes the overlay as thumbor.filters.watermark does.'''
+        self.x = self.detect_and_get_ratio_position(self.x, sz[0])
+        self.y = self.detect_and_get_ratio_position(self.y, sz[1])
+
+        mos_x = self.x == 'repeat'
+        mos_y = self.y == 'repeat'
+        center_x = self.x == 'center'
+        center_y = self.y == 'center'
+        if not center_x and not mos_x:
+            inv_x = self.x[0] == '-'
+            x = int(self.x)
+        if not center_y and not mos_y:
+            inv_y = self.y[0] == '-'
+            y = int(self.y)
+
+        if not mos_x:
+            repeat_x = (1, 0)
+            if center_x:
+                x = (sz[0] - watermark_sz[0]) / 2
+            elif inv_x:
+                x = (sz[0] - watermark_sz[0]) + x
+        else:
+            repeat_x = divmod(sz[0], watermark_sz[0])
+            if sz[0] * 1.0 / watermark_sz[0] < 2:
+                repeat_x = (math.ceil(sz[0] * 1.0 / watermark_sz[0]), 10)
+        if not mos_y:
+            repeat_y = (1, 0)
+            if center_y:
+                y = (sz[1] - watermark_sz[1]) / 2
+            elif inv_y:
+                y = (sz[1] - watermark_sz[1]) + y
+        else:
+            repeat_y = divmod(sz[1], watermark_sz[1])
+            if sz[1] * 1.0 / watermark_sz[1] < 2:
+                repeat_y = (math.ceil(sz[1] * 1.0 / watermark_sz[1]), 10)
+
+        if not mos_x and not mos_y:
+            self.engine.paste(self.watermark_engine, (x, y), merge=True)
+        elif mos_x and mos_y:
+            if (repeat_x[0] * repeat_y[0]) > 100:
+                tmpRepeatX = min(6, repeat_x[0])
+                tmpRepeatY = min(6, repeat_y[0])
+                repeat_x = (tmpRepeatX, sz[0] - tmpRepeatX * watermark_sz[0])
+                repeat_y = (tmpRepeatY, sz[1] - tmpRepeatY * watermark_sz[1])
+            space_x = repeat_x[1] / (max(repeat_x[0], 2) - 1)
+            space_y = repeat_y[1] / (max(repeat_y[0], 2) - 1)
+            for i in range(int(repeat_x[0])):
+                x = i * space_x + i * watermark_sz[0]
+                for j in range(int(repeat_y[0])):
+                    y = j * space_y + j * watermark_sz[1]
+                    self.engine.paste(self.watermark_engine, (x, y),
+                                      merge=True)
+        elif mos_x:
+            space_x = repeat_x[1] / (max(repeat_x[0], 2) - 1)
+            for i in range(int(repeat_x[0])):
+                x = i * space_x + i * watermark_sz[0]
+                self.engine.paste(self.watermark_engine, (x, y), merge=True)
+        else:
+            space_y = repeat_y[1] / (max(repeat_y[0], 2) - 1)
+            for j in range(int(repeat_y[0])):
+                y = j * space_y + j * watermark_sz[1]
+                self.engine.paste(self.watermark_engine, (x, y), merge=True)
+
+        self.callback()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Compares smart detection on the full-resolution source against the
+downscaled proxy used by lambda_proxy_detector.
+
+    python benchmark_detectors.py [image ...]
+
+For each image it prints the detection time of both paths and how far the
+proxy's center of mass (which drives the smart crop) lands from the
+full-resolution one, as a percentage of the image diagonal.'''
+
+from __future__ import print_function
+import glob
+import math
+import os
+import sys
+import timeit
+from thumbor.config import Config
+from thumbor.context import Context, RequestParameters
+from thumbor.detectors import face_detector, feature_detector
+from thumbor.engines.pil import Engine
+from thumbor.importer import Importer
+from image_handler import lambda_proxy_detector
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+
+def load_context(path):
+    config = Config(DETECTOR_PROXY_MAX_SIZE=600)
+    context = Context(config=config, importer=Importer(config))
+    context.request = RequestParameters()
+    context.modules.engine = Engine(context)
+    with open(path, 'rb') as source:
+        context.modules.engine.load(source.read(), os.path.splitext(path)[1])
+    return context
+
+
+def center_of_mass(points):
+    total = sum(point.weight for point in points) or 1.0
+    return (sum(point.x * point.weight for point in points) / total,
+            sum(point.y * point.weight for point in points) / total)
+
+
+def run(context, detectors):
+    context.request.focal_points = []
+    start = timeit.default_timer()
+    detectors[0](context, 0, detectors).detect(lambda: None)
+    return timeit.default_timer() - start, context.request.focal_points
+
+
+def main(paths):
+    full = [face_detector.Detector, feature_detector.Detector]
+    proxy = [lambda_proxy_detector.Detector] + full
+    print('%-16s %12s %10s %10s %8s' %
+          ('image', 'size', 'full ms', 'proxy ms', 'offset'))
+    for path in paths:
+        context = load_context(path)
+        width, height = context.modules.engine.size
+        full_time, full_points = run(context, full)
+        proxy_time, proxy_points = run(context, proxy)
+        full_x, full_y = center_of_mass(full_points)
+        proxy_x, proxy_y = center_of_mass(proxy_points)
+        offset = math.hypot(full_x - proxy_x, full_y - proxy_y) /\
+            math.hypot(width, height)
+        print('%-16s %12s %10.1f %10.1f %7.2f%%' % (
+            os.path.basename(path)[:16], '%dx%d' % (width, height),
+            full_time * 1000, proxy_time * 1000, offset * 100))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sorted(glob.glob(
+        os.path.join(__location__, '..', '..', 'ui', 'img', '*.jpg'))))
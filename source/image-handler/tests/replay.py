@@ -0,0 +1,405 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+'''Replays production access logs against local handler instances to size
+memory, caches and concurrency before a deployment.
+
+    python replay.py log [log ...]
+
+Logs are CloudFront standard logs (plain or gzipped) or API Gateway
+access logs written as one JSON object per line with $context.httpMethod,
+$context.path (or resourcePath) and $context.requestTimeEpoch (or
+requestTime). Every GET and HEAD becomes the event lambda_handler expects
+and is handed, at its logged offset divided by REPLAY_SPEEDUP (0 replays
+as fast as possible), to the first idle of REPLAY_CONCURRENCY worker
+processes. Each worker stands in for one container: its own Thumbor
+(started by its first request, as on a cold start), caches and memory,
+one request at a time.
+
+S3 is served by a local stand-in that reads originals from
+REPLAY_SOURCE_PATH/<bucket>/<key>, keeps writes in a temporary directory
+and answers every connection on its own thread after
+REPLAY_S3_LATENCY_MS. Neither log format records the
+Accept header, so REPLAY_ACCEPT (default image/webp,*/*) is sent with
+every request; REPLAY_LIMIT caps the number of requests. The handler reads
+the rest of its settings (RESULT_CACHE_*, MEMORY_*, DEGRADE_*, ...) from
+the environment as usual, with SERVER_MEMORY_LIMIT_MB as the function's
+MemorySize.
+
+The report covers status codes, where each response came from (a result
+cache tier or a render), service time and time spent queued for a free
+worker, the peak RSS of single requests and workers, and S3 traffic.'''
+
+from __future__ import print_function
+import BaseHTTPServer
+import SocketServer
+import calendar
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib
+from email.utils import formatdate
+from image_handler import lambda_cache
+from image_handler import lambda_function
+from image_handler import lambda_memory
+from image_handler import lambda_s3
+from image_handler import lambda_server
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+not_found_body = '<?xml version="1.0" encoding="UTF-8"?>\n<Error>'\
+    '<Code>NoSuchKey</Code><Message>The specified key does not exist.'\
+    '</Message></Error>'
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path)
+    return open(path)
+
+
+def cloudfront_time(date, clock):
+    return calendar.timegm(time.strptime(date + ' ' + clock,
+                                         '%Y-%m-%d %H:%M:%S'))
+
+
+def api_gateway_time(entry):
+    if entry.get('requestTimeEpoch'):
+        return int(entry['requestTimeEpoch']) / 1000.0
+    # 19/Oct/2026:12:00:00 +0000
+    stamp, _, offset = str(entry.get('requestTime', '')).partition(' ')
+    seconds = calendar.timegm(time.strptime(stamp, '%d/%b/%Y:%H:%M:%S'))
+    if offset:
+        sign = -1 if offset.startswith('-') else 1
+        seconds -= sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+    return seconds
+
+
+def parse_log(lines):
+    '''Yields (timestamp, method, raw path, headers) for every GET and
+    HEAD in a CloudFront or API Gateway log.'''
+    fields = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        if line.startswith('#Fields:'):
+            fields = line[len('#Fields:'):].split()
+            continue
+        if line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            entry = json.loads(line)
+            method = entry.get('httpMethod')
+            path = entry.get('path') or entry.get('resourcePath')
+            when = api_gateway_time(entry)
+            query = ''
+        elif fields is not None:
+            entry = dict(zip(fields, line.split('\t')))
+            method = entry.get('cs-method')
+            path = entry.get('cs-uri-stem')
+            when = cloudfront_time(entry['date'], entry['time'])
+            query = entry.get('cs-uri-query', '-')
+        else:
+            continue
+        if method not in ('GET', 'HEAD') or not path:
+            continue
+        if query and query != '-':
+            path = path + '?' + query
+        headers = {'Accept': os.environ.get('REPLAY_ACCEPT') or
+                   'image/webp,*/*'}
+        yield when, method, path, headers
+
+
+def load_requests(paths, limit=None):
+    requests = []
+    for path in paths:
+        with open_log(path) as log:
+            requests.extend(parse_log(log))
+    requests.sort(key=lambda request: request[0])
+    if limit:
+        requests = requests[:limit]
+    return requests
+
+
+class S3Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Path-style GetObject, HeadObject and PutObject on local files.'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def locate(self):
+        key = urllib.unquote(self.path.partition('?')[0]).lstrip('/')
+        written = os.path.join(self.server.written, key)
+        if os.path.isfile(written):
+            return written
+        return os.path.join(self.server.root, key)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = self.locate()
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(not_found_body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(not_found_body)
+            return
+        with open(path, 'rb') as source:
+            body = source.read()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"%s"' % hashlib.md5(body).hexdigest())
+        self.send_header('Last-Modified',
+                         formatdate(os.path.getmtime(path), usegmt=True))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        time.sleep(self.server.latency)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        key = urllib.unquote(self.path.partition('?')[0]).lstrip('/')
+        path = os.path.join(self.server.written, key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as target:
+            target.write(body)
+        self.send_response(200)
+        self.send_header('ETag', '"%s"' % hashlib.md5(body).hexdigest())
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def end_headers(self):
+        # one request per connection, so an idle keep-alive client never
+        # holds on to a handler thread
+        self.send_header('Connection', 'close')
+        self.close_connection = 1
+        BaseHTTPServer.BaseHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class S3StandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, root, latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), S3Handler)
+        self.root = root
+        self.latency = latency
+        self.written = tempfile.mkdtemp()
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return t
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        shutil.rmtree(self.written, ignore_errors=True)
+
+
+def hits():
+    '''Hit counters of the negative cache and each result cache tier.'''
+    stats = lambda_cache.stats()
+    counts = dict((name, tier['Hits']) for name, tier in
+                  stats.get('ResultCache', {}).items())
+    counts['Negative'] = stats.get('NegativeCache', {}).get('Hits', 0)
+    return counts
+
+
+def served_from(before, after):
+    for name in ['Negative'] + [tier.name for tier in
+                                (lambda_cache.result_cache.tiers
+                                 if lambda_cache.result_cache else [])]:
+        if after.get(name, 0) > before.get(name, 0):
+            return name
+    return 'Handler'
+
+
+def handle(event):
+    before = hits()
+    lambda_memory.reset_peak()
+    start = timeit.default_timer()
+    response = lambda_function.lambda_handler(
+        event, lambda_server.ServerContext())
+    elapsed = timeit.default_timer() - start
+    return {
+        'Status': int(response['statusCode']),
+        'Seconds': elapsed,
+        'Source': served_from(before, hits()),
+        'PeakRss': lambda_memory.read_status().get('VmHWM', 0),
+        'Degraded': (response.get('headers') or {}).get(
+            'X-Image-Handler-Degraded')
+    }
+
+
+def worker(task_id, tasks, results):
+    # Thumbor starts on the first request, a cold start as on Lambda
+    lambda_server.use_socket(task_id)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        scheduled, event = task
+        queued = max(0, time.time() - scheduled)
+        outcome = handle(event)
+        outcome['Queued'] = queued
+        results.put(('request', outcome))
+    results.put(('worker', {
+        'Cache': lambda_cache.stats(),
+        'S3': lambda_s3.stats()['S3'],
+        'Rss': lambda_memory.read_status().get('VmRSS', 0)
+    }))
+
+
+def dispatch(requests, tasks, speedup):
+    '''Queues each request at its logged offset divided by speedup.'''
+    if not requests:
+        return
+    first = requests[0][0]
+    start = time.time()
+    for when, method, path, headers in requests:
+        scheduled = start
+        if speedup > 0:
+            scheduled = start + (when - first) / speedup
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        tasks.put((max(scheduled, start),
+                   lambda_server.build_event(method, path, headers)))
+
+
+def percentile(samples, value):
+    if not samples:
+        return 0
+    return samples[min(len(samples) * value / 100, len(samples) - 1)]
+
+
+def summarize(outcomes, workers, elapsed):
+    report = {'Requests': len(outcomes), 'Seconds': round(elapsed, 3)}
+    report['Throughput'] = round(len(outcomes) / elapsed, 2) if elapsed else 0
+    for name, key in (('Status', 'Status'), ('Source', 'Source')):
+        counts = {}
+        for outcome in outcomes:
+            counts[outcome[key]] = counts.get(outcome[key], 0) + 1
+        report[name] = counts
+    report['Degraded'] = sum(1 for outcome in outcomes
+                             if outcome['Degraded'])
+    for name, key in (('LatencyMs', 'Seconds'), ('QueuedMs', 'Queued')):
+        samples = sorted(outcome[key] for outcome in outcomes)
+        report[name] = dict(
+            ('P%d' % value, int(percentile(samples, value) * 1000))
+            for value in (50, 90, 99, 100))
+    peaks = sorted(outcome['PeakRss'] for outcome in outcomes)
+    report['PeakRssMb'] = dict(
+        ('P%d' % value, percentile(peaks, value) / (1024 * 1024))
+        for value in (50, 99, 100))
+    report['WorkerRssMb'] = [worker['Rss'] / (1024 * 1024)
+                             for worker in workers]
+    cache = {}
+    s3 = {}
+    for worker in workers:
+        for tier, stats in worker['Cache'].get('ResultCache', {}).items():
+            totals = cache.setdefault(tier, {'Hits': 0, 'Misses': 0})
+            totals['Hits'] += stats['Hits']
+            totals['Misses'] += stats['Misses']
+        for name, value in worker['S3'].items():
+            if not name.endswith('Ms'):
+                s3[name] = s3.get(name, 0) + value
+        s3['P99Ms'] = max(s3.get('P99Ms', 0), worker['S3'].get('P99Ms', 0))
+    for totals in cache.values():
+        lookups = totals['Hits'] + totals['Misses']
+        totals['HitRate'] = round(totals['Hits'] / float(lookups), 3)\
+            if lookups else 0
+    report['ResultCache'] = cache
+    report['S3'] = s3
+    return report
+
+
+def replay(requests, concurrency, speedup):
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker,
+                                         args=(task_id, tasks, results))
+                 for task_id in range(concurrency)]
+    for process in processes:
+        process.daemon = True
+        process.start()
+    start = time.time()
+    dispatch(requests, tasks, speedup)
+    for process in processes:
+        tasks.put(None)
+    outcomes = []
+    workers = []
+    while len(workers) < concurrency:
+        kind, data = results.get()
+        if kind == 'request':
+            outcomes.append(data)
+        else:
+            workers.append(data)
+    elapsed = time.time() - start
+    for process in processes:
+        process.join()
+    return summarize(outcomes, workers, elapsed)
+
+
+def main(paths):
+    lambda_function.log_level = str(os.environ.get('LOG_LEVEL') or
+                                    'ERROR').upper()
+    lambda_function.thumbor_config_path = os.environ.get(
+        'THUMBOR_CONFIG_PATH') or os.path.join(
+            __location__, '..', 'thumbor.conf')
+    requests = load_requests(paths, int(os.environ.get('REPLAY_LIMIT') or 0))
+    stand_in = S3StandIn(
+        os.environ.get('REPLAY_SOURCE_PATH') or os.getcwd(),
+        int(os.environ.get('REPLAY_S3_LATENCY_MS') or 0) / 1000.0)
+    stand_in.start()
+    os.environ['TC_AWS_ENDPOINT'] = stand_in.endpoint
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ.setdefault(name, 'replay')
+    try:
+        report = replay(
+            requests,
+            int(os.environ.get('REPLAY_CONCURRENCY') or 1),
+            float(os.environ.get('REPLAY_SPEEDUP') or 1))
+    finally:
+        stand_in.stop()
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
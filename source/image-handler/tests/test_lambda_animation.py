@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from io import BytesIO
+from PIL import Image
+from image_handler import lambda_animation
+from thumbor.config import Config
+from thumbor.url import Url
+from test.test_support import EnvironmentVarGuard
+
+
+def animated_gif(frames, size=(40, 20)):
+    images = [Image.new('P', size, color) for color in range(frames)]
+    buffer = BytesIO()
+    images[0].save(buffer, 'GIF', save_all=True,
+                   append_images=images[1:], duration=100)
+    return buffer.getvalue()
+
+
+class frame_info_test_case(unittest.TestCase):
+
+    def test_animated(self):
+        self.assertEqual(lambda_animation.frame_info(animated_gif(3)),
+                         (40, 20, 3))
+
+    def test_static_and_other_formats(self):
+        self.assertEqual(lambda_animation.frame_info(animated_gif(1)),
+                         (40, 20, 1))
+        self.assertIsNone(lambda_animation.frame_info('\x89PNG\r\n\x1a\n'))
+
+    def test_stops_past_limit(self):
+        self.assertEqual(lambda_animation.frame_info(animated_gif(6), 2)[2],
+                         3)
+
+
+class gifsicle_arguments_test_case(unittest.TestCase):
+
+    def arguments(self, path, first_frame=False):
+        return lambda_animation.gifsicle_arguments(
+            Url.parse_decrypted(path), 400, 200, first_frame)
+
+    def test_fit_in(self):
+        self.assertEqual(self.arguments('/fit-in/100x0/a.gif')[2:],
+                         ['--resize-fit', '100x_', '-'])
+
+    def test_fill_crops_to_aspect_ratio(self):
+        self.assertEqual(self.arguments('/100x100/a.gif')[2:],
+                         ['--crop', '100,0-300,200', '--resize', '100x100',
+                          '-'])
+        self.assertEqual(self.arguments('/100x100/left/a.gif')[2:5],
+                         ['--crop', '0,0-200,200', '--resize'])
+
+    def test_manual_crop_flips_and_first_frame(self):
+        self.assertEqual(
+            self.arguments('/10x10:110x60/-50x0/a.gif', first_frame=True)[2:],
+            ['--crop', '10,10-110,60', '--flip-horizontal',
+             '--resize-width', '50', '-', '#0'])
+
+
+class supported_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.tool = tempfile.NamedTemporaryFile()
+        self.env = EnvironmentVarGuard()
+
+    def tearDown(self):
+        self.tool.close()
+
+    def supported(self, path, config=None):
+        return lambda_animation.supported(Url.parse_decrypted(path),
+                                          config or Config())
+
+    def test_supported(self):
+        self.assertTrue(self.supported('/fit-in/100x100/a.gif'))
+        self.assertTrue(self.supported('/smart/100x100/a.gif'))
+        self.assertTrue(self.supported(
+            '/100x100/filters:quality(80):gifv()/a.gif',
+            Config(FFMPEG_PATH=self.tool.name)))
+
+    def test_requested_output_needs_its_tool(self):
+        gifv = '/100x100/filters:gifv(webm)/a.gif'
+        webp = '/100x100/filters:format(webp)/a.gif'
+        self.assertFalse(self.supported(gifv))
+        self.assertFalse(self.supported(
+            webp, Config(GIF2WEBP_PATH=self.tool.name)))
+        self.env.set('ANIMATION_WEBP', 'Yes')
+        with self.env:
+            self.assertFalse(self.supported(webp))
+            self.assertTrue(self.supported(
+                webp, Config(GIF2WEBP_PATH=self.tool.name)))
+
+    def test_unsupported(self):
+        self.assertFalse(self.supported('/trim/100x100/a.gif'))
+        self.assertFalse(self.supported('/100x100/filters:blur(2)/a.gif'))
+        self.assertFalse(self.supported('/100x100/a.gif',
+                                        Config(MAX_WIDTH=800)))
+
+    def test_output_type(self):
+        env = EnvironmentVarGuard()
+        env.set('ANIMATION_WEBP', 'Yes')
+        values = Url.parse_decrypted('/filters:gifv(webm)/a.gif')
+        plain = Url.parse_decrypted('/a.gif')
+        with env:
+            self.assertEqual(lambda_animation.output_type(values, True),
+                             'webm')
+            self.assertEqual(lambda_animation.output_type(plain, True),
+                             'webp')
+        self.assertEqual(lambda_animation.output_type(plain, True), 'gif')
+
+
+class render_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, 'arguments')
+        self.config = Config(GIFSICLE_PATH=self.tool(
+            'echo "$@" > %s; cat' % self.log))
+        self.values = Url.parse_decrypted('/fit-in/20x20/a.gif')
+        self.env = EnvironmentVarGuard()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def tool(self, script):
+        path = os.path.join(self.tmpdir, 'tool%d' % len(os.listdir(
+            self.tmpdir)))
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n%s\n' % script)
+        os.chmod(path, stat.S_IRWXU)
+        return path
+
+    def test_animation_is_piped_through_gifsicle(self):
+        source = animated_gif(3)
+        content_type, body, capped = lambda_animation.render(
+            self.config, self.values, source, False)
+        self.assertEqual((content_type, body, capped),
+                         ('image/gif', source, False))
+        with open(self.log) as f:
+            self.assertIn('--resize-fit 20x20 -', f.read())
+
+    def test_frame_cap_keeps_first_frame(self):
+        self.env.set('ANIMATION_MAX_FRAMES', '2')
+        with self.env:
+            content_type, body, capped = lambda_animation.render(
+                self.config, self.values, animated_gif(3), False)
+        self.assertTrue(capped)
+        with open(self.log) as f:
+            self.assertTrue(f.read().strip().endswith('- #0'))
+
+    def test_static_gif_is_left_to_thumbor(self):
+        self.assertIsNone(lambda_animation.render(
+            self.config, self.values, animated_gif(1), False))
+
+    def test_timeout(self):
+        self.config.GIFSICLE_PATH = self.tool('exec sleep 5')
+        with self.assertRaises(lambda_animation.RenderTimeout):
+            lambda_animation.render(self.config, self.values,
+                                    animated_gif(3), False, timeout=0.1)
+
+if __name__ == '__main__':
+    unittest.main()
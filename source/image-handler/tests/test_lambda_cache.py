@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+import shutil
+import tempfile
+from image_handler.lambda_cache import NegativeCache
+from image_handler.lambda_cache import LRUCache
+from image_handler.lambda_cache import MemoryTier
+from image_handler.lambda_cache import DiskTier
+from image_handler.lambda_cache import TieredCache
+
+
+class negative_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = NegativeCache(max_entries=2, ttl=60,
+                                   clock=lambda: self.now[0])
+
+    def test_contains_until_expired(self):
+        self.cache.add('missing.jpg')
+        self.assertTrue(self.cache.contains('missing.jpg'))
+        self.now[0] += 61
+        self.assertFalse(self.cache.contains('missing.jpg'))
+        self.assertEqual(self.cache.stats()['Entries'], 0)
+
+    def test_bounded(self):
+        for key in ['a.jpg', 'b.jpg', 'c.jpg']:
+            self.cache.add(key)
+        self.assertFalse(self.cache.contains('a.jpg'))
+        self.assertTrue(self.cache.contains('c.jpg'))
+        self.assertEqual(self.cache.stats()['Evictions'], 1)
+        self.assertEqual(self.cache.stats()['Hits'], 1)
+        self.assertEqual(self.cache.stats()['Misses'], 1)
+
+    def test_zero_size_stores_nothing(self):
+        cache = NegativeCache(max_entries=0, ttl=60)
+        cache.add('missing.jpg')
+        self.assertFalse(cache.contains('missing.jpg'))
+        self.assertEqual(cache.stats()['Evictions'], 0)
+
+
+class lru_cache_test_case(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['Evictions'], 1)
+
+
+class tiered_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.memory = MemoryTier(10)
+        self.disk = DiskTier(self.tmpdir, 1024)
+        self.cache = TieredCache([self.memory, self.disk])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def result(self, body):
+        return {'body': body, 'content_type': 'image/jpeg'}
+
+    def test_promotes_disk_hits(self):
+        self.disk.put('hot', self.result('12345'))
+        self.assertEqual(self.cache.get('hot')['body'], '12345')
+        self.assertEqual(self.memory.get('hot')['body'], '12345')
+        self.assertEqual(self.disk.stats()['Hits'], 1)
+        self.assertEqual(self.disk.stats()['BytesServed'], 5)
+
+    def test_admission_protects_frequent_keys(self):
+        for i in range(3):
+            self.cache.get('hot')
+        self.cache.put('hot', self.result('1234567'))
+        self.cache.get('once')
+        self.cache.put('once', self.result('1234567'))
+        self.assertIsNotNone(self.memory.get('hot'))
+        self.assertIsNone(self.memory.get('once'))
+        self.assertEqual(self.memory.stats()['Rejections'], 1)
+        self.assertEqual(self.disk.get('once')['body'], '1234567')
+
+    def test_disk_index_survives_restart(self):
+        self.disk.put('key', self.result('body'))
+        disk = DiskTier(self.tmpdir, 1024)
+        self.assertEqual(disk.get('key')['content_type'], 'image/jpeg')
+
+    def test_disk_shared_between_processes(self):
+        other = DiskTier(self.tmpdir, 1024)
+        self.disk.put('key', self.result('body'))
+        self.assertEqual(other.get('key')['body'], 'body')
+        self.assertEqual(other.stats()['Entries'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+from image_handler import lambda_client_hints
+from thumbor.url import Url
+from test.test_support import EnvironmentVarGuard
+
+
+class apply_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('CLIENT_HINTS_BUCKETS', '320,640,1280')
+
+    def apply(self, path, headers):
+        with self.env:
+            return lambda_client_hints.apply(
+                path, Url.parse_decrypted(path), headers)[0]
+
+    def test_width_hint_picks_bucket(self):
+        self.assertEqual(self.apply('/200x0/image.jpg', {'Width': '500'}),
+                         '/640x0/image.jpg')
+        self.assertEqual(
+            self.apply('/200x0/image.jpg', {'sec-ch-width': '2000'}),
+            '/1280x0/image.jpg')
+
+    def test_dpr_scales_explicit_size(self):
+        self.assertEqual(
+            self.apply('/fit-in/200x100/smart/image.jpg', {'DPR': '2'}),
+            '/fit-in/640x320/smart/image.jpg')
+        self.assertEqual(self.apply('/200x100/image.jpg', {'DPR': '1'}),
+                         '/200x100/image.jpg')
+
+    def test_originals_are_left_alone(self):
+        for path in ['/image.jpg', '/0x0/image.jpg', '/origx0/image.jpg']:
+            self.assertEqual(
+                self.apply(path, {'Width': '500', 'DPR': '2',
+                                  'Save-Data': 'on'}), path)
+
+    def test_never_below_requested_width(self):
+        self.assertEqual(self.apply('/3000x0/image.jpg', {'DPR': '2'}),
+                         '/3000x0/image.jpg')
+        self.assertEqual(self.apply('/1000x500/image.jpg', {'Width': '300'}),
+                         '/1000x500/image.jpg')
+
+    def test_height_only_is_left_alone(self):
+        self.assertEqual(self.apply('/0x300/image.jpg', {'Width': '500'}),
+                         '/0x300/image.jpg')
+
+    def test_save_data_lowers_quality(self):
+        self.env.set('CLIENT_HINTS_SAVE_DATA_QUALITY', '40')
+        self.assertEqual(
+            self.apply('/trim/100x0/filters:quality(90):grayscale()/a.jpg',
+                       {'Save-Data': 'on'}),
+            '/trim/100x0/filters:grayscale():quality(40)/a.jpg')
+
+    def test_add_headers_keeps_vary(self):
+        response = lambda_client_hints.add_headers(
+            {'headers': {'Vary': 'Accept'}})
+        self.assertTrue(response['headers']['Vary'].startswith('Accept, DPR'))
+        self.assertIn('Sec-CH-Width', response['headers']['Accept-CH'])
+
+if __name__ == '__main__':
+    unittest.main()
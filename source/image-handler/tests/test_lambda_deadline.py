@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+from image_handler import lambda_deadline
+from image_handler import lambda_operations
+from test.test_support import EnvironmentVarGuard
+
+
+class shed_stages_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('DEGRADE_ENABLED', 'Yes')
+
+    def test_progressive_shedding(self):
+        with self.env:
+            self.assertEqual(lambda_deadline.shed_stages(9000), [])
+            self.assertEqual(lambda_deadline.shed_stages(5000),
+                             ['optimizers'])
+            self.assertEqual(lambda_deadline.shed_stages(500),
+                             ['optimizers', 'smart', 'quality', 'variant'])
+            self.assertEqual(lambda_deadline.shed_stages(None), [])
+
+    def test_disabled(self):
+        with self.env:
+            self.env.unset('DEGRADE_ENABLED')
+            self.assertEqual(lambda_deadline.shed_stages(500), [])
+
+
+class degrade_path_test_case(unittest.TestCase):
+
+    def degrade(self, path, stages):
+        return lambda_deadline.degrade_path(lambda_operations.parse(path),
+                                            stages)
+
+    def test_drops_smart_and_lowers_quality(self):
+        self.assertEqual(
+            self.degrade(
+                '/100x100/smart/filters:grayscale():quality(90)/a/smart/b.jpg',
+                ['smart', 'quality']),
+            '/100x100/filters:grayscale():quality(60)/a/smart/b.jpg')
+
+    def test_adds_quality_filter(self):
+        self.assertEqual(
+            self.degrade('/fit-in/100x100/b.jpg', ['optimizers', 'quality']),
+            '/fit-in/100x100/filters:quality(60)/b.jpg')
+
+    def test_filter_argument_with_slash(self):
+        self.assertEqual(
+            self.degrade('/unsafe/fit-in/300x300/filters:watermark('
+                         'wm/logo.png,-10,-10,50):quality(80)/photos/a.jpg',
+                         ['quality']),
+            '/unsafe/fit-in/300x300/filters:watermark('
+            'wm/logo.png,-10,-10,50):quality(60)/photos/a.jpg')
+
+    def test_optimizers_only_keeps_path(self):
+        self.assertEqual(
+            self.degrade('/100x100/smart/b.jpg', ['optimizers']),
+            '/100x100/smart/b.jpg')
+
+
+class smaller_variants_test_case(unittest.TestCase):
+
+    def values(self, path):
+        return lambda_operations.parse(path).values
+
+    def test_largest_fitting_variant_first(self):
+        for path, digest in [('/100x100/v.jpg', 'small'),
+                             ('/300x300/v.jpg', 'medium'),
+                             ('/900x900/v.jpg', 'large')]:
+            lambda_deadline.record_variant(self.values(path), '', digest)
+        self.assertEqual(
+            lambda_deadline.smaller_variants(self.values('/400x400/v.jpg'),
+                                             ''),
+            ['medium', 'small'])
+        self.assertEqual(
+            lambda_deadline.smaller_variants(self.values('/400x400/v.jpg'),
+                                             'webp'), [])
+
+    def test_other_options_do_not_match(self):
+        lambda_deadline.record_variant(
+            self.values('/100x100/filters:grayscale()/w.jpg'), '', 'gray')
+        lambda_deadline.record_variant(
+            self.values('/fit-in/100x100/w.jpg'), '', 'fit')
+        lambda_deadline.record_variant(
+            self.values('/100x100/w.jpg'), '', 'plain')
+        self.assertEqual(
+            lambda_deadline.smaller_variants(self.values('/400x400/w.jpg'),
+                                             ''),
+            ['plain'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import os
+import socket
+import unittest
+import shutil
+import tempfile
+from mock import Mock, patch
+from thumbor.config import Config
+from thumbor.context import Context
+from image_handler import lambda_detector_storage
+from image_handler import lambda_function
+
+
+class detector_storage_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.context = Context(config=Config(
+            DETECTOR_STORAGE_FILE_ROOT_PATH=self.tmpdir))
+        self.points = [{'x': 10, 'y': 20, 'z': 1, 'height': 5, 'width': 5,
+                        'origin': 'Face Detection'}]
+        lambda_detector_storage.focal_points.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get(self, storage, path):
+        callback = Mock()
+        storage.get_detector_data(path, callback=callback)
+        return callback.call_args[0][0]
+
+    def test_points_are_shared_by_etag(self):
+        storage = lambda_detector_storage.Storage(self.context)
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value='"abc"'):
+            storage.put_detector_data('a.jpg', self.points)
+            lambda_detector_storage.focal_points.clear()
+            self.assertEqual(self.get(storage, 'copy-of-a.jpg'), self.points)
+
+    def test_unknown_source(self):
+        storage = lambda_detector_storage.Storage(self.context)
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value=None):
+            storage.put_detector_data('a.jpg', self.points)
+            self.assertIsNone(self.get(storage, 'a.jpg'))
+
+
+class socket_test_case(unittest.TestCase):
+    '''The file tier must work while Thumbor's unix socket exists.'''
+
+    def setUp(self):
+        self.listener = None
+        if not os.path.exists(lambda_function.thumbor_socket):
+            self.listener = socket.socket(socket.AF_UNIX)
+            self.listener.bind(lambda_function.thumbor_socket)
+        conf = os.path.join(
+            os.path.dirname(lambda_detector_storage.__file__), 'thumbor.conf')
+        self.roots = [Config.load(conf).DETECTOR_STORAGE_FILE_ROOT_PATH,
+                      None]
+        self.written = []
+
+    def tearDown(self):
+        for path in self.written:
+            if os.path.exists(path):
+                os.remove(path)
+        if self.listener is not None:
+            self.listener.close()
+            os.remove(lambda_function.thumbor_socket)
+
+    def test_file_tier_beside_socket(self):
+        points = [{'x': 1, 'y': 2, 'z': 1, 'height': 1, 'width': 1,
+                   'origin': 'Face Detection'}]
+        for root in self.roots:
+            config = Config()
+            if root is not None:
+                config.DETECTOR_STORAGE_FILE_ROOT_PATH = root
+            storage = lambda_detector_storage.Storage(Context(config=config))
+            path = storage.file_path('socket-test')
+            self.written.append(path)
+            with patch('logging.error') as error:
+                storage.write_file('socket-test', points)
+            self.assertFalse(error.called)
+            self.assertEqual(storage.read_file('socket-test'), points)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,12 +16,26 @@
 ##############################################################################
 
 import unittest
+import base64
+import shutil
+import tempfile
+import threading
 import timeit
-from mock import patch
+import requests
+from io import BytesIO
+from mock import Mock, patch
+from PIL import Image
 from image_handler.lambda_function import start_server
 from image_handler.lambda_function import send_metrics
 from event import import_event
 from image_handler.lambda_function import response_formater
+from image_handler.lambda_function import call_thumbor
+from image_handler import lambda_cache
+from image_handler import lambda_function
+from image_handler import lambda_operations
+from image_handler import lambda_result_storage
+from thumbor.config import Config
+from test.test_support import EnvironmentVarGuard
 
 
 class start_server_test_case(unittest.TestCase):
@@ -50,5 +64,461 @@ class send_metrics_test_case(unittest.TestCase):
                 self.timestamp
             )
 
+
+class response_formater_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('ENABLE_CORS', 'Yes')
+        self.env.set('CORS_ORIGIN', '*')
+
+    def test_error_response_headers(self):
+        with self.env:
+            response = response_formater(status_code='404',
+                                         cache_control='max-age=60,public')
+            self.assertEqual(response['statusCode'], '404')
+            self.assertEqual(response['body'], '{"message": "error"}')
+            self.assertEqual(response['headers']['Cache-Control'],
+                             'max-age=60,public')
+            self.assertEqual(
+                response['headers']['Access-Control-Allow-Origin'], '*')
+
+    def test_error_response_is_not_shared(self):
+        with self.env:
+            first = response_formater(status_code='404')
+            first['headers']['Vary'] = 'Accept'
+            second = response_formater(status_code='404')
+            self.assertNotIn('Vary', second['headers'])
+
+    def test_success_response(self):
+        with self.env:
+            response = response_formater(status_code='200', body='Ym9keQ==',
+                                         content_type='image/jpeg',
+                                         etag='"abc"', vary='Accept')
+            self.assertEqual(response['isBase64Encoded'], 'true')
+            self.assertEqual(response['headers']['Etag'], '"abc"')
+            self.assertEqual(response['headers']['Vary'], 'Accept')
+
+
+class negative_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('NEGATIVE_CACHE_ENABLED', 'Yes')
+        self.env.set('NEGATIVE_CACHE_TTL', '30')
+        self.event = import_event()
+        self.event['path'] = '/fit-in/100x100/missing.jpg'
+        lambda_cache.negative_cache = None
+
+    def test_repeated_miss_skips_thumbor(self):
+        thumbor_response = Mock(status_code=404)
+        with self.env, \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)) as down, \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)):
+            first = call_thumbor(self.event)
+            second = call_thumbor(self.event)
+            self.assertEqual(down.call_count, 1)
+        self.assertEqual(first['statusCode'], '404')
+        self.assertEqual(second['statusCode'], '404')
+        self.assertEqual(second['headers']['Cache-Control'],
+                         'max-age=30,public')
+        self.assertTrue(lambda_cache.negative_cache.contains('missing.jpg'))
+
+    def test_rewritten_path_miss_is_recorded(self):
+        thumbor_response = Mock(status_code=404)
+        self.env.set('REWRITE_ENABLED', 'Yes')
+        self.env.set('REWRITE_PATTERNS', '[["^/thumb/", "/100x100/"]]')
+        self.event['path'] = '/thumb/missing.jpg'
+        with self.env, \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)):
+            response = call_thumbor(self.event)
+        self.assertEqual(response['statusCode'], '404')
+        self.assertTrue(lambda_cache.get_negative_cache().contains(
+            'missing.jpg'))
+
+    def test_degraded_path_miss_is_not_recorded(self):
+        thumbor_response = Mock(status_code=404)
+        self.env.set('DEGRADE_ENABLED', 'Yes')
+        self.event['path'] = '/fit-in/100x100/smart/missing.jpg'
+        context = Mock()
+        context.get_remaining_time_in_millis.return_value = 3000
+        with self.env, \
+                patch('image_handler.lambda_function.config',
+                      Config(ALLOW_UNSAFE_URL=True)), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)) as req:
+            call_thumbor(self.event, context)
+        self.assertEqual(req.call_args[0][2], '/fit-in/100x100/missing.jpg')
+        self.assertFalse(lambda_cache.get_negative_cache().contains(
+            'missing.jpg'))
+
+
+def wait_for_uploads():
+    for t in threading.enumerate():
+        if t.name == 'result-storage':
+            t.join()
+
+
+class result_storage_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('RESULT_CACHE_ENABLED', 'Yes')
+        self.tmpdir = tempfile.mkdtemp()
+        self.env.set('RESULT_CACHE_DISK_PATH', self.tmpdir)
+        self.event = import_event()
+        self.event['path'] = '/fit-in/100x100/image.jpg'
+        self.config = Config(AUTO_WEBP=False, ALLOW_UNSAFE_URL=True,
+                             TC_AWS_RESULT_STORAGE_BUCKET='results')
+        lambda_cache.result_cache = None
+        self.cached = {
+            'body': 'image',
+            'content_type': 'image/jpeg',
+            'cache_control': 'max-age=60,public',
+            'etag': '"abc"'
+        }
+
+    def tearDown(self):
+        lambda_cache.result_cache = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit_skips_thumbor(self):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config,
+                      create=True), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)) as down, \
+                patch(storage + '.source_etag', return_value='"src"'), \
+                patch(storage + '.fetch', return_value=self.cached), \
+                patch('image_handler.lambda_function.request_thumbor') as req:
+            response = call_thumbor(self.event)
+            self.assertFalse(req.called)
+            # a hit neither checks nor starts Thumbor
+            self.assertFalse(down.called)
+        self.assertEqual(response['statusCode'], '200')
+        self.assertEqual(response['body'], 'aW1hZ2U=')
+        self.assertEqual(response['headers']['Etag'], '"abc"')
+
+    def test_miss_stores_render(self):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        thumbor_response = Mock(status_code=200, content='image', headers={
+            'content-type': 'image/jpeg',
+            'Cache-Control': 'max-age=60,public',
+            'Expires': '', 'Etag': '"abc"', 'Date': ''
+        })
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config,
+                      create=True), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch(storage + '.source_etag', return_value='"src"'), \
+                patch(storage + '.fetch', return_value=None), \
+                patch(storage + '.store') as store, \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)):
+            release = threading.Event()
+            uploaded = []
+
+            def slow_store(*args):
+                release.wait(5)
+                uploaded.append(args)
+                return True
+            store.side_effect = slow_store
+            response = call_thumbor(self.event)
+            # the response does not wait for the upload
+            self.assertEqual(uploaded, [])
+            release.set()
+            wait_for_uploads()
+            self.assertEqual(store.call_args[0][2], self.cached)
+            cached = call_thumbor(self.event)
+            self.assertEqual(store.call_count, 1)
+        self.assertEqual(response['statusCode'], '200')
+        self.assertEqual(cached['body'], response['body'])
+        self.assertEqual(lambda_cache.stats()['ResultCache']['Memory']['Hits'],
+                         1)
+
+    def test_head_uses_stored_metadata(self):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        self.event['requestContext']['httpMethod'] = 'HEAD'
+        metadata = dict(self.cached, content_length=1234)
+        del metadata['body']
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config,
+                      create=True), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch(storage + '.source_etag', return_value='"src"'), \
+                patch(storage + '.head', return_value=metadata), \
+                patch(storage + '.fetch') as fetch, \
+                patch('image_handler.lambda_function.request_thumbor') as req:
+            response = call_thumbor(self.event)
+            self.assertFalse(fetch.called)
+            self.assertFalse(req.called)
+        self.assertEqual(response['statusCode'], '200')
+        self.assertEqual(response['body'], '')
+        self.assertEqual(response['headers']['Content-Length'], '1234')
+        self.assertEqual(response['headers']['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['headers']['Etag'], '"abc"')
+
+    def test_head_without_metadata_renders(self):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        self.event['requestContext']['httpMethod'] = 'HEAD'
+        thumbor_response = Mock(status_code=200, content='image', headers={
+            'content-type': 'image/jpeg',
+            'Cache-Control': 'max-age=60,public',
+            'Expires': '', 'Etag': '"abc"', 'Date': ''
+        })
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config,
+                      create=True), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch(storage + '.source_etag', return_value='"src"'), \
+                patch(storage + '.head', return_value=None), \
+                patch(storage + '.fetch', return_value=None), \
+                patch(storage + '.store'), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)):
+            response = call_thumbor(self.event)
+            cached = call_thumbor(self.event)
+            wait_for_uploads()
+        self.assertEqual(response['body'], '')
+        self.assertEqual(response['headers']['Content-Length'], '5')
+        self.assertEqual(cached['headers']['Content-Length'], '5')
+
+
+class deadline_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('DEGRADE_ENABLED', 'Yes')
+        self.event = import_event()
+        self.event['path'] = '/fit-in/100x100/smart/image.jpg'
+        self.context = Mock()
+        self.context.get_remaining_time_in_millis.return_value = 3000
+        self.config = Config(ALLOW_UNSAFE_URL=True)
+        self.patcher = patch('image_handler.lambda_function.config',
+                             self.config)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_sheds_stages_and_reports_them(self):
+        thumbor_response = Mock(status_code=200, content='image', headers={
+            'content-type': 'image/jpeg',
+            'Cache-Control': 'max-age=31536000,public',
+            'Expires': '', 'Etag': '"abc"', 'Date': ''
+        })
+        with self.env, \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)) as req:
+            response = call_thumbor(self.event, self.context)
+            path, stages, timeout = req.call_args[0][2:]
+        self.assertEqual(path, '/fit-in/100x100/image.jpg')
+        self.assertEqual(stages, ['optimizers', 'smart'])
+        self.assertEqual(timeout, 2.5)
+        self.assertEqual(response['headers']['Cache-Control'],
+                         'max-age=60,public')
+        self.assertEqual(
+            response['headers']['X-Image-Handler-Degraded'],
+            'optimizers,smart')
+
+    def test_signed_path_keeps_its_options(self):
+        self.config.ALLOW_UNSAFE_URL = False
+        self.event['path'] = '/0123456789abcdef0123456789ab=/100x100/smart/'\
+            'image.jpg'
+        with self.env, \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      side_effect=requests.exceptions.Timeout()) as req:
+            call_thumbor(self.event, self.context)
+            path, stages = req.call_args[0][2:4]
+        self.assertEqual(path, self.event['path'])
+        self.assertEqual(stages, ['optimizers'])
+
+    def test_timeout_returns_503(self):
+        with self.env, \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      side_effect=requests.exceptions.Timeout()):
+            response = call_thumbor(self.event, self.context)
+        self.assertEqual(response['statusCode'], '503')
+        self.assertEqual(response['headers']['Retry-After'], '1')
+
+
+class passthrough_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('PASSTHROUGH_ENABLED', 'Yes')
+        self.event = import_event()
+        self.config = Config(AUTO_WEBP=False, ALLOW_UNSAFE_URL=True,
+                             MAX_AGE=86400)
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+        self.source = buffer.getvalue()
+
+    def call(self, path):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        self.event['path'] = path
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(Mock(), None)) as down, \
+                patch(storage + '.source_etag', return_value='"src"'), \
+                patch(storage + '.fetch_source', return_value=self.source):
+            return call_thumbor(self.event), down.called
+
+    def test_noop_serves_original(self):
+        response, thumbor_called = self.call('/image.png')
+        self.assertFalse(thumbor_called)
+        self.assertEqual(response['statusCode'], '200')
+        self.assertEqual(response['body'], base64.b64encode(self.source))
+        self.assertEqual(response['headers']['Content-Type'], 'image/png')
+        self.assertEqual(response['headers']['Etag'], '"src"')
+        self.assertEqual(response['headers']['Cache-Control'],
+                         'max-age=86400,public')
+
+    def test_head_reads_source_metadata(self):
+        self.event['requestContext']['httpMethod'] = 'HEAD'
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        with patch(storage + '.head_source', return_value={
+                    'ContentType': 'image/png', 'ContentLength': 321,
+                    'ETag': '"src"'}):
+            response, thumbor_called = self.call('/image.png')
+        self.assertFalse(thumbor_called)
+        self.assertEqual(response['body'], '')
+        self.assertEqual(response['headers']['Content-Length'], '321')
+        self.assertEqual(response['headers']['Etag'], '"src"')
+
+    def test_resize_goes_to_thumbor(self):
+        response, thumbor_called = self.call('/100x100/image.png')
+        self.assertTrue(thumbor_called)
+
+    def test_signed_url_goes_to_thumbor(self):
+        self.config.ALLOW_UNSAFE_URL = False
+        response, thumbor_called = self.call('/image.png')
+        self.assertTrue(thumbor_called)
+
+    def test_disallowed_bucket_is_not_found(self):
+        self.config.TC_AWS_LOADER_BUCKET = None
+        self.config.TC_AWS_ALLOWED_BUCKETS = ['photos']
+        response, thumbor_called = self.call('/private/image.png')
+        self.assertFalse(thumbor_called)
+        self.assertEqual(response['statusCode'], '404')
+
+
+class animation_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('ANIMATION_ENABLED', 'Yes')
+        self.event = import_event()
+        self.config = Config(AUTO_WEBP=False, ALLOW_UNSAFE_URL=True,
+                             MAX_AGE=86400)
+
+    def call(self, path, rendered):
+        storage = 'image_handler.lambda_function.lambda_result_storage'
+        self.event['path'] = path
+        thumbor_response = Mock(status_code=500)
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, Mock())), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)) as thumbor, \
+                patch(storage + '.fetch_source', return_value='GIF89a'), \
+                patch('image_handler.lambda_function.lambda_animation.render',
+                      return_value=rendered) as render:
+            return call_thumbor(self.event), thumbor.called, render.called
+
+    def test_animation_skips_thumbor(self):
+        response, thumbor_called, rendered = self.call(
+            '/fit-in/100x100/banner.gif', ('image/gif', 'gif', True))
+        self.assertFalse(thumbor_called)
+        self.assertEqual(response['body'], base64.b64encode('gif'))
+        self.assertEqual(response['headers']['Content-Type'], 'image/gif')
+        self.assertEqual(response['headers']['Cache-Control'],
+                         'max-age=86400,public')
+        self.assertEqual(
+            response['headers']['X-Image-Handler-Degraded'], 'frames')
+
+    def test_capped_render_is_not_cached(self):
+        values = lambda_operations.parse('/fit-in/100x100/banner.gif').values
+        cache = Mock()
+        with self.env, \
+                patch('image_handler.lambda_function.config', self.config), \
+                patch('image_handler.lambda_function.result_cache',
+                      return_value=cache), \
+                patch('image_handler.lambda_function.lambda_result_storage.'
+                      'fetch_source', return_value='GIF89a'), \
+                patch('image_handler.lambda_function.lambda_animation.render',
+                      return_value=('image/gif', 'gif', True)):
+            response = lambda_function.animation_response(
+                self.event, values, 'digest')
+        self.assertEqual(
+            response['headers']['X-Image-Handler-Degraded'], 'frames')
+        self.assertFalse(cache.put.called)
+
+    def test_disallowed_bucket_is_not_found(self):
+        self.config.TC_AWS_LOADER_BUCKET = None
+        self.config.TC_AWS_ALLOWED_BUCKETS = ['photos']
+        response, thumbor_called, rendered = self.call(
+            '/fit-in/100x100/private/banner.gif', ('image/gif', 'gif', False))
+        self.assertFalse(thumbor_called)
+        self.assertFalse(rendered)
+        self.assertEqual(response['statusCode'], '404')
+
+    def test_static_gif_goes_to_thumbor(self):
+        response, thumbor_called, rendered = self.call(
+            '/fit-in/100x100/banner.gif', None)
+        self.assertTrue(rendered)
+        self.assertTrue(thumbor_called)
+        # the loader gets the bytes already fetched
+        self.assertEqual(lambda_result_storage.take_source(
+            self.config, 'banner.gif'), 'GIF89a')
+
+    def test_other_images_are_not_fetched(self):
+        response, thumbor_called, rendered = self.call(
+            '/fit-in/100x100/photo.jpg', None)
+        self.assertFalse(rendered)
+        self.assertTrue(thumbor_called)
+
+
+class client_hints_test_case(unittest.TestCase):
+
+    def test_request_is_bucketed(self):
+        env = EnvironmentVarGuard()
+        env.set('CLIENT_HINTS_ENABLED', 'Yes')
+        env.set('CLIENT_HINTS_BUCKETS', '320,640')
+        event = import_event()
+        event['path'] = '/fit-in/300x200/image.jpg'
+        event['headers'] = {'DPR': '2'}
+        thumbor_response = Mock(status_code=404)
+        with env, \
+                patch('image_handler.lambda_function.config',
+                      Config(ALLOW_UNSAFE_URL=True)), \
+                patch('image_handler.lambda_function.is_thumbor_down',
+                      return_value=(False, None)), \
+                patch('image_handler.lambda_function.request_thumbor',
+                      return_value=(thumbor_response, False)) as req:
+            response = call_thumbor(event)
+        self.assertEqual(req.call_args[0][2], '/fit-in/640x427/image.jpg')
+        self.assertIn('DPR', response['headers']['Vary'])
+        self.assertIn('DPR', response['headers']['Accept-CH'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock, patch
+from image_handler import lambda_cache
+from image_handler import lambda_memory
+from image_handler import lambda_operations
+from image_handler import lambda_overlay
+from image_handler import lambda_result_storage
+from test.test_support import EnvironmentVarGuard
+
+
+class govern_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('MEMORY_GOVERNOR_ENABLED', 'Yes')
+        self.env.set('MEMORY_WATERMARK_PERCENT', '50')
+        self.tmpdir = tempfile.mkdtemp()
+        self.status = os.path.join(self.tmpdir, 'status')
+        self.context = Mock(memory_limit_in_mb=128)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_status(self, rss_mb, peak_mb):
+        with open(self.status, 'w') as status:
+            status.write('Name:\tpython\nVmHWM:\t%d kB\nVmRSS:\t%d kB\n' %
+                         (peak_mb * 1024, rss_mb * 1024))
+
+    def test_below_watermark(self):
+        self.write_status(40, 90)
+        with self.env, \
+                patch.object(lambda_memory, 'status_path', self.status), \
+                patch.object(lambda_memory, 'trim') as trim:
+            lambda_memory.govern(self.context)
+            stats = lambda_memory.stats()['Memory']
+        self.assertFalse(trim.called)
+        self.assertEqual(stats['PeakRssMb'], 90)
+        self.assertEqual(stats['RssMb'], 40)
+
+    def test_above_watermark_trims(self):
+        self.write_status(100, 110)
+        with self.env, \
+                patch.object(lambda_memory, 'status_path', self.status), \
+                patch.object(lambda_memory, 'trim') as trim:
+            lambda_memory.govern(self.context)
+        self.assertTrue(trim.called)
+
+    def test_trim_empties_memory_tier(self):
+        self.env.set('RESULT_CACHE_DISK_BYTES', '0')
+        with self.env:
+            lambda_cache.result_cache = None
+            cache = lambda_cache.get_result_cache()
+            cache.put('key', {'body': 'image'})
+            lambda_memory.trim()
+            self.assertIsNone(cache.get('key'))
+        lambda_cache.result_cache = None
+
+    def test_trim_empties_container_caches(self):
+        lambda_overlay.get_assets().put('logo', {'body': 'rgba'})
+        lambda_operations.parse('/100x100/image.jpg')
+        lambda_result_storage.source_etags.put('image.jpg', '"abc"')
+        lambda_memory.trim()
+        self.assertEqual(lambda_overlay.get_assets().stats()['Entries'], 0)
+        self.assertEqual(
+            lambda_operations.get_operations().stats()['Entries'], 0)
+        self.assertIsNone(lambda_result_storage.source_etags.get('image.jpg'))
+
+    def test_disabled(self):
+        with self.env:
+            self.env.unset('MEMORY_GOVERNOR_ENABLED')
+            self.assertEqual(lambda_memory.stats(), {})
+
+if __name__ == '__main__':
+    unittest.main()
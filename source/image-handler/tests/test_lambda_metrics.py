@@ -15,9 +15,12 @@
 #  permissions and limitations under the License.                            #
 ##############################################################################
 
+import json
 import unittest
 import timeit
 from urllib2 import Request
+from image_handler import lambda_metrics
+from image_handler import lambda_operations
 from image_handler.lambda_metrics import send_data
 from image_handler.lambda_function import response_formater
 from event import import_event
@@ -29,6 +32,45 @@ class send_data_test_case(unittest.TestCase):
     def test_send_data(self):
         self.assertTrue(send_data(import_event(),response_formater(),timeit.default_timer()))
 
+
+class log_data_test_case(unittest.TestCase):
+
+    def test_emits_embedded_metrics(self):
+        response = response_formater(status_code='200')
+        response['headers']['X-Image-Handler-Degraded'] = 'smart,quality'
+        stats = {'NegativeCache': {'Hits': 2, 'Misses': 1},
+                 'Memory': {'Enabled': True, 'RssMb': 120}}
+        with patch('image_handler.lambda_metrics.container_stats',
+                   return_value=stats), patch('sys.stdout') as stdout:
+            record = lambda_metrics.log_data(response, timeit.default_timer())
+        self.assertTrue(stdout.write.called)
+        self.assertEqual(record['NegativeCache.Hits'], 2)
+        self.assertEqual(record['Memory.RssMb'], 120)
+        self.assertNotIn('Memory.Enabled', record)
+        self.assertEqual(record['Degradations'], ['smart', 'quality'])
+        names = [metric['Name'] for metric in
+                 record['_aws']['CloudWatchMetrics'][0]['Metrics']]
+        self.assertIn('NegativeCache.Misses', names)
+        self.assertIn('ResponseTime', names)
+
+    def test_anonymous_payload_has_no_container_stats(self):
+        with patch('image_handler.lambda_metrics.urlopen') as urlopen:
+            request = send_data(import_event(), response_formater(),
+                                timeit.default_timer())
+        data = json.loads(request.get_data())['Data']
+        self.assertEqual(sorted(data.keys()), [
+            'Company', 'Filters', 'Name', 'Region', 'ResponseSize',
+            'ResponseTime', 'StatusCode', 'Version'])
+
+    def test_filters_without_image(self):
+        with patch('image_handler.lambda_metrics.urlopen'), \
+                patch('image_handler.lambda_metrics.lambda_operations.parse',
+                      return_value=lambda_operations.Operations('/', None)):
+            request = send_data(import_event(), response_formater(),
+                                timeit.default_timer())
+        self.assertEqual(json.loads(request.get_data())['Data']['Filters'],
+                         {})
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+import unittest
+from mock import patch
+from image_handler import lambda_operations
+from test.test_support import EnvironmentVarGuard
+
+
+class operations_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        lambda_operations.operations = None
+
+    def tearDown(self):
+        lambda_operations.operations = None
+
+    def test_parses_options(self):
+        operations = lambda_operations.parse(
+            '/unsafe/fit-in/200x100/filters:quality(80)/photo.jpg')
+        self.assertEqual(operations.values['image'], 'photo.jpg')
+        self.assertEqual(operations.options['width'], 200)
+        self.assertEqual(operations.options['filters'], 'quality(80)')
+        self.assertNotIn('image', operations.options)
+
+    def test_path_without_image(self):
+        operations = lambda_operations.parse('')
+        self.assertIsNone(operations.values)
+        self.assertIsNone(operations.options)
+
+    def test_repeated_path_is_parsed_once(self):
+        with patch('image_handler.lambda_operations.Url.parse_decrypted',
+                   wraps=lambda_operations.Url.parse_decrypted) as parser:
+            first = lambda_operations.parse('/100x100/photo.jpg')
+            second = lambda_operations.parse('/100x100/photo.jpg')
+        self.assertIs(first, second)
+        self.assertEqual(parser.call_count, 1)
+        self.assertEqual(lambda_operations.stats()['OperationsCache']['Hits'],
+                         1)
+
+    def test_rewrite_settings_are_part_of_the_key(self):
+        with self.env:
+            self.env['REWRITE_ENABLED'] = 'Yes'
+            self.env['REWRITE_PATTERNS'] = '[["^/thumb/", "/100x100/"]]'
+            rewritten = lambda_operations.parse('/thumb/photo.jpg')
+            self.env['REWRITE_ENABLED'] = 'No'
+            plain = lambda_operations.parse('/thumb/photo.jpg')
+        self.assertEqual(rewritten.path, '/100x100/photo.jpg')
+        self.assertEqual(rewritten.values['width'], 100)
+        self.assertEqual(plain.values['image'], 'thumb/photo.jpg')
+
+    def test_cache_can_be_turned_off(self):
+        with self.env:
+            self.env['OPERATIONS_CACHE_SIZE'] = '0'
+            first = lambda_operations.parse('/100x100/photo.jpg')
+            second = lambda_operations.parse('/100x100/photo.jpg')
+        self.assertIsNot(first, second)
+        self.assertEqual(lambda_operations.stats(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import unittest
+from io import BytesIO
+from mock import patch
+from PIL import Image
+from thumbor.config import Config
+from thumbor.context import Context, RequestParameters
+from thumbor.engines.pil import Engine
+from thumbor.filters import frame, watermark
+from thumbor.importer import Importer
+from thumbor.storages.no_storage import Storage
+from image_handler import lambda_frame
+from image_handler import lambda_overlay
+from image_handler import lambda_watermark
+from test.test_support import EnvironmentVarGuard
+
+
+def png(size, color):
+    buffer = BytesIO()
+    Image.new('RGBA', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class CountingLoader(object):
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.loads = 0
+
+    def load(self, context, url, callback):
+        self.loads += 1
+        callback(self.buffer)
+
+
+class overlay_test_case(unittest.TestCase):
+
+    def setUp(self):
+        lambda_overlay.assets = None
+        self.loader = CountingLoader(png((40, 20), (255, 0, 0, 255)))
+        self.etag = '"v1"'
+        self.patcher = patch(
+            'image_handler.lambda_overlay.lambda_result_storage.source_etag',
+            side_effect=lambda config, url: self.etag)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        lambda_overlay.assets = None
+
+    def context(self):
+        config = Config()
+        context = Context(config=config, importer=Importer(config))
+        context.request = RequestParameters()
+        context.modules.engine = Engine(context)
+        context.modules.engine.load(png((100, 80), (0, 0, 255, 255)), '.png')
+        context.modules.loader = self.loader
+        context.modules.storage = Storage(context)
+        return context
+
+    def apply(self, cls, params):
+        cls.pre_compile()
+        context = self.context()
+        cls(params, context).run(lambda: None)
+        return context.modules.engine.image.tobytes()
+
+    def test_watermark_matches_thumbor_and_is_decoded_once(self):
+        params = 'watermark(logo.png,-10,center,50,30)'
+        expected = self.apply(watermark.Filter, params)
+        self.assertEqual(self.apply(lambda_watermark.Filter, params),
+                         expected)
+        self.assertEqual(self.apply(lambda_watermark.Filter, params),
+                         expected)
+        # thumbor's filter, then the first cached one
+        self.assertEqual(self.loader.loads, 2)
+        self.assertEqual(lambda_overlay.assets.stats()['Entries'], 3)
+
+    def test_new_etag_reloads(self):
+        params = 'watermark(logo.png,0,0,0)'
+        self.apply(lambda_watermark.Filter, params)
+        self.etag = '"v2"'
+        self.apply(lambda_watermark.Filter, params)
+        self.assertEqual(self.loader.loads, 2)
+
+    def test_http_overlays_are_not_cached(self):
+        params = 'watermark(http://example.com/logo.png,0,0,0)'
+        self.apply(lambda_watermark.Filter, params)
+        self.apply(lambda_watermark.Filter, params)
+        self.assertEqual(self.loader.loads, 2)
+
+    def test_frame_matches_thumbor(self):
+        self.loader.buffer = png((12, 12), (0, 0, 0, 255))
+        expected = self.apply(frame.Filter, 'frame(frame.png)')
+        self.assertEqual(self.apply(lambda_frame.Filter, 'frame(frame.png)'),
+                         expected)
+        self.assertEqual(self.apply(lambda_frame.Filter, 'frame(frame.png)'),
+                         expected)
+        self.assertEqual(self.loader.loads, 2)
+
+    def test_preload(self):
+        env = EnvironmentVarGuard()
+        env.set('OVERLAY_PRELOAD', 'logo.png, frame.png')
+        storage = 'image_handler.lambda_overlay.lambda_result_storage'
+        with env, patch(storage + '.fetch_source',
+                        return_value=self.loader.buffer):
+            lambda_overlay.preload(self.context())
+        self.apply(lambda_watermark.Filter, 'watermark(logo.png,0,0,0)')
+        self.assertEqual(self.loader.loads, 0)
+        self.assertEqual(lambda_overlay.stats()['OverlayCache']['Hits'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import unittest
+from image_handler import lambda_passthrough
+from thumbor.config import Config
+from thumbor.url import Url
+from test.test_support import EnvironmentVarGuard
+
+
+class is_noop_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+
+    def noop(self, path):
+        return lambda_passthrough.is_noop(Url.parse_decrypted(path),
+                                          self.config)
+
+    def test_unchanged_requests(self):
+        self.assertTrue(self.noop('/image.jpg'))
+        self.assertTrue(self.noop('/fit-in/smart/image.jpg'))
+        self.assertTrue(self.noop('/origxorig/image.jpg'))
+
+    def test_changing_requests(self):
+        self.assertFalse(self.noop('/100x0/image.jpg'))
+        self.assertFalse(self.noop('/-0x0/image.jpg'))
+        self.assertFalse(self.noop('/10x10:20x20/image.jpg'))
+        self.assertFalse(self.noop('/trim/image.jpg'))
+        self.assertFalse(self.noop('/meta/image.jpg'))
+        self.assertFalse(self.noop('/filters:grayscale()/image.jpg'))
+
+    def test_max_size_limits(self):
+        self.config.MAX_WIDTH = 1000
+        self.assertFalse(self.noop('/image.jpg'))
+
+
+class optimize_test_case(unittest.TestCase):
+
+    def test_skipped_without_jpegtran(self):
+        env = EnvironmentVarGuard()
+        env.set('PASSTHROUGH_OPTIMIZE', 'Yes')
+        config = Config(JPEGTRAN_PATH='/nonexistent/jpegtran')
+        with env:
+            self.assertEqual(
+                lambda_passthrough.optimize(config, 'image/jpeg', 'body'),
+                'body')
+            self.assertEqual(
+                lambda_passthrough.optimize(config, 'image/png', 'body'),
+                'body')
+
+if __name__ == '__main__':
+    unittest.main()
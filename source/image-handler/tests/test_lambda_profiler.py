@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from mock import patch
+from image_handler import lambda_function
+from image_handler import lambda_profiler
+from event import import_event
+from test.test_support import EnvironmentVarGuard
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class requested_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('PROFILE_SECRET', 'secret')
+        self.event = {'path': '/fit-in/100x100/image.jpg', 'headers': {}}
+
+    def test_signed_header(self):
+        self.event['headers']['x-image-handler-profile'] =\
+            lambda_profiler.signature('secret', self.event['path'])
+        with self.env:
+            self.assertTrue(lambda_profiler.requested(self.event))
+
+    def test_wrong_signature(self):
+        self.event['headers']['X-Image-Handler-Profile'] =\
+            lambda_profiler.signature('secret', '/other.jpg')
+        with self.env:
+            self.assertFalse(lambda_profiler.requested(self.event))
+
+    def test_not_requested(self):
+        with self.env:
+            self.assertFalse(lambda_profiler.requested(self.event))
+
+
+class sampler_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentVarGuard()
+        self.env.set('PROFILE_ENABLED', 'Yes')
+        self.env.set('PROFILE_INTERVAL_MS', '1')
+        self.tmpdir = tempfile.mkdtemp()
+        self.env.set('PROFILE_PATH', self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_writes_collapsed_stacks(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,),
+                                  name='worker')
+        event = {'path': '/image.jpg', 'requestContext': {'requestId': 'abc'}}
+        with self.env:
+            sampler = lambda_profiler.start(event)
+            worker.start()
+            time.sleep(0.05)
+            name = lambda_profiler.finish(sampler, event)
+        stop.set()
+        worker.join()
+        self.assertEqual(name, 'abc.collapsed')
+        with open(os.path.join(self.tmpdir, name)) as profile:
+            lines = profile.read().splitlines()
+        self.assertTrue(any(
+            line.startswith('worker;') and 'busy_loop' in line
+            for line in lines))
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+    def test_keeps_recent_profiles(self):
+        self.env.set('PROFILE_MAX_FILES', '2')
+        with self.env:
+            for request_id in ['a', 'b', 'c']:
+                event = {'path': '/image.jpg',
+                         'requestContext': {'requestId': request_id}}
+                lambda_profiler.finish(lambda_profiler.start(event), event)
+                time.sleep(0.01)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ['b.collapsed', 'c.collapsed'])
+
+    def test_handler_error_stops_sampling(self):
+        event = import_event()
+        with self.env, \
+                patch('image_handler.lambda_function.call_thumbor',
+                      side_effect=RuntimeError('render failed')), \
+                patch('image_handler.lambda_profiler.finish',
+                      wraps=lambda_profiler.finish) as finish:
+            response = lambda_function.lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], '500')
+        sampler = finish.call_args[0][0]
+        self.assertFalse(sampler.thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
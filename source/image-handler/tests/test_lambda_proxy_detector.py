@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+from mock import Mock
+from PIL import Image
+from thumbor.config import Config
+from thumbor.detectors import BaseDetector
+from thumbor.point import FocalPoint
+from image_handler.lambda_proxy_detector import Detector
+
+
+class square_detector(BaseDetector):
+
+    def detect(self, callback):
+        self.context.request.focal_points.append(
+            FocalPoint.from_square(100, 50, 20, 20))
+        callback()
+
+
+class proxy_detector_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Mock()
+        self.context.config = Config(DETECTOR_PROXY_MAX_SIZE=600)
+        self.context.request.focal_points = []
+        self.context.modules.engine.image = Image.new('RGB', (2400, 1200))
+        self.context.modules.engine.size = (2400, 1200)
+
+    def test_detects_on_proxy_and_rescales(self):
+        callback = Mock()
+        Detector(self.context, 0, [Detector, square_detector]).detect(callback)
+        callback.assert_called_once_with()
+        point = self.context.request.focal_points[0]
+        self.assertEqual((point.x, point.y), (440, 240))
+        self.assertEqual((point.width, point.height), (80, 80))
+        self.assertEqual(point.weight, 6400)
+
+    def test_proxy_is_bounded_grayscale(self):
+        seen = []
+
+        class recording_detector(square_detector):
+            def detect(self, callback):
+                seen.append((self.context.modules.engine.size,
+                             self.context.modules.engine.image.mode))
+                callback()
+
+        Detector(self.context, 0, [Detector, recording_detector]).detect(
+            Mock())
+        self.assertEqual(seen, [((600, 300), 'L')])
+
+if __name__ == '__main__':
+    unittest.main()
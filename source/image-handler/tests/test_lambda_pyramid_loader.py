@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+from io import BytesIO
+from mock import Mock, patch
+from PIL import Image
+from thumbor.config import Config
+from image_handler import lambda_pyramid_loader
+from image_handler import lambda_result_storage
+
+
+class choose_level_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.manifest = {'width': 4000, 'height': 3000, 'levels': [2, 4, 8]}
+
+    def request(self, width, height, **kwargs):
+        return Mock(width=width, height=height, meta=False,
+                    crop=kwargs.get('crop', {}),
+                    filters=kwargs.get('filters', ''))
+
+    def test_smallest_covering_level(self):
+        choose = lambda_pyramid_loader.choose_level
+        self.assertEqual(choose(self.manifest, self.request(300, 200)), 8)
+        self.assertEqual(choose(self.manifest, self.request(800, 0)), 4)
+        self.assertEqual(choose(self.manifest, self.request(1500, 1500)), 2)
+        self.assertEqual(choose(self.manifest, self.request(3000, 0)), 1)
+
+    def test_original_needed(self):
+        choose = lambda_pyramid_loader.choose_level
+        self.assertEqual(choose(self.manifest, self.request(0, 0)), 1)
+        self.assertEqual(choose(self.manifest, self.request('orig', 100)), 1)
+        self.assertEqual(choose(self.manifest, self.request(
+            100, 100, crop={'left': 10, 'top': 10, 'right': 500,
+                            'bottom': 500})), 1)
+        self.assertEqual(choose(self.manifest, self.request(
+            300, 200, filters='focal(100x100:400x400):quality(80)')), 1)
+        self.assertEqual(choose(self.manifest, self.request(
+            300, 200, filters='quality(80)')), 8)
+
+
+class build_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config(TC_AWS_STORAGE_BUCKET='storage',
+                             PYRAMID_LEVELS=[2, 4, 8], PYRAMID_MIN_SIZE=64)
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600)).save(buffer, 'JPEG')
+        self.data = buffer.getvalue()
+        lambda_pyramid_loader.manifests.clear()
+
+    def test_build_stores_levels_and_manifest(self):
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value='"abc"'), \
+                patch.object(lambda_pyramid_loader, 'put_object') as put:
+            manifest = lambda_pyramid_loader.build(self.config, 'a.jpg',
+                                                   self.data)
+        self.assertEqual(manifest, {'etag': '"abc"', 'width': 800,
+                                    'height': 600, 'levels': [2, 4, 8]})
+        names = [call[0][2] for call in put.call_args_list]
+        self.assertEqual(names, ['2', '4', '8', 'manifest.json'])
+        level = Image.open(BytesIO(put.call_args_list[2][0][3]))
+        self.assertEqual(level.size, (100, 75))
+
+    def test_gif_gets_manifest_without_levels(self):
+        buffer = BytesIO()
+        Image.new('P', (800, 600)).save(buffer, 'GIF')
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value='"abc"'), \
+                patch.object(lambda_pyramid_loader, 'put_object') as put:
+            manifest = lambda_pyramid_loader.build(self.config, 'a.gif',
+                                                   buffer.getvalue())
+            self.assertEqual(manifest, {'etag': '"abc"', 'width': 800,
+                                        'height': 600, 'levels': []})
+            self.assertEqual(put.call_args_list[0][0][2], 'manifest.json')
+            self.assertEqual(put.call_count, 1)
+            self.assertEqual(lambda_pyramid_loader.get_manifest(
+                self.config, 'a.gif'), manifest)
+
+    def test_manifest_without_levels_is_not_rebuilt(self):
+        self.config.PYRAMID_ENABLED = True
+        lambda_pyramid_loader.manifests.put('a.gif', {
+            'etag': '"abc"', 'width': 800, 'height': 600, 'levels': []})
+        context = Mock(config=self.config)
+        context.request = Mock(image_url='a.gif', width=100, height=75,
+                               meta=False, crop={}, filters='')
+        callback = Mock()
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value='"abc"'), \
+                patch.object(lambda_pyramid_loader, 'get_object') as get, \
+                patch.object(lambda_pyramid_loader,
+                             'build_in_background') as build, \
+                patch.object(lambda_pyramid_loader, 'load_source',
+                             side_effect=lambda c, u, cb: cb('gif')):
+            lambda_pyramid_loader.load(context, 'a.gif', callback)
+        self.assertFalse(get.called)
+        self.assertFalse(build.called)
+        callback.assert_called_once_with('gif')
+
+    def test_stale_manifest_is_ignored(self):
+        lambda_pyramid_loader.manifests.put('a.jpg', {
+            'etag': '"old"', 'width': 800, 'height': 600, 'levels': [2]})
+        with patch('image_handler.lambda_result_storage.source_etag',
+                   return_value='"new"'):
+            self.assertIsNone(
+                lambda_pyramid_loader.get_manifest(self.config, 'a.jpg'))
+
+    def test_overlays_load_the_source(self):
+        self.config.PYRAMID_ENABLED = True
+        context = Mock(config=self.config)
+        context.request = Mock(image_url='a.jpg', width=100, height=75,
+                               meta=False, crop={}, pyramid_level=1)
+        callback = Mock()
+        with patch.object(lambda_pyramid_loader, 'get_manifest') as manifest, \
+                patch.object(lambda_pyramid_loader, 'load_source',
+                             side_effect=lambda c, u, cb: cb('overlay')):
+            lambda_pyramid_loader.load(context, 'wm/logo.png', callback)
+        self.assertFalse(manifest.called)
+        self.assertEqual(context.request.pyramid_level, 1)
+        callback.assert_called_once_with('overlay')
+
+
+    def test_handed_off_source_is_not_fetched(self):
+        context = Mock(config=self.config)
+        lambda_result_storage.hand_off_source(self.config, 'a.jpg', 'image')
+        callback = Mock()
+        with patch.object(lambda_result_storage, 'lambda_s3') as s3:
+            lambda_pyramid_loader.load_source(context, 'a.jpg', callback)
+        self.assertFalse(s3.get_object.called)
+        callback.assert_called_once_with('image')
+        self.assertIsNone(
+            lambda_result_storage.take_source(self.config, 'a.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
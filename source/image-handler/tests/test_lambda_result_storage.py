@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import unittest
+from botocore.exceptions import ClientError
+from mock import Mock, patch
+from thumbor.config import Config
+from image_handler import lambda_result_storage
+
+
+class result_storage_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            'TC_AWS_LOADER_BUCKET': 'originals',
+            'TC_AWS_LOADER_ROOT_PATH': 'images',
+            'TC_AWS_RESULT_STORAGE_BUCKET': 'results',
+            'TC_AWS_RESULT_STORAGE_ROOT_PATH': 'rendered'
+        }
+        self.operations = {'width': 100, 'height': 100, 'filters': ''}
+
+    def test_result_key_is_content_addressed(self):
+        key = lambda_result_storage.result_key(
+            '"etag"', self.operations, '', (85, 80))
+        self.assertEqual(key, lambda_result_storage.result_key(
+            '"etag"', dict(self.operations), '', (85, 80)))
+        self.assertNotEqual(key, lambda_result_storage.result_key(
+            '"other"', self.operations, '', (85, 80)))
+        self.assertNotEqual(key, lambda_result_storage.result_key(
+            '"etag"', self.operations, 'webp', (85, 80)))
+
+    def test_locations(self):
+        self.assertEqual(
+            lambda_result_storage.source_location(self.config, 'a%20b.jpg'),
+            ('originals', 'images/a b.jpg'))
+        self.assertEqual(
+            lambda_result_storage.result_location(self.config, 'abcdef'),
+            ('results', 'rendered/ab/abcdef'))
+
+    def test_source_bucket_from_path(self):
+        config = Config(TC_AWS_LOADER_BUCKET=None,
+                        TC_AWS_ALLOWED_BUCKETS=['photos'])
+        self.assertEqual(
+            lambda_result_storage.source_location(config, 'photos/a.jpg'),
+            ('photos', 'a.jpg'))
+        self.assertTrue(
+            lambda_result_storage.source_allowed(config, 'photos/a.jpg'))
+        self.assertFalse(
+            lambda_result_storage.source_allowed(config, 'private/a.jpg'))
+
+    def test_disallowed_source_is_not_fetched(self):
+        config = Config(TC_AWS_LOADER_BUCKET=None,
+                        TC_AWS_ALLOWED_BUCKETS=['photos'])
+        client = Mock()
+        with patch.object(lambda_result_storage, 'client', client):
+            self.assertIsNone(
+                lambda_result_storage.fetch_source(config, 'private/a.jpg'))
+            self.assertIsNone(
+                lambda_result_storage.head_source(config, 'private/a.jpg'))
+        self.assertFalse(client.get_object.called)
+        self.assertFalse(client.head_object.called)
+
+    def test_fetch_miss(self):
+        client = Mock()
+        client.get_object.side_effect = ClientError(
+            {'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        with patch.object(lambda_result_storage, 'client', client):
+            self.assertIsNone(
+                lambda_result_storage.fetch(self.config, 'abcdef'))
+
+    def test_fetch_hit(self):
+        client = Mock()
+        client.get_object.return_value = {
+            'Body': Mock(read=Mock(return_value='image')),
+            'ContentType': 'image/jpeg',
+            'CacheControl': 'max-age=60,public',
+            'Metadata': {'thumbor-etag': '"abc"'}
+        }
+        with patch.object(lambda_result_storage, 'client', client):
+            result = lambda_result_storage.fetch(self.config, 'abcdef')
+        client.get_object.assert_called_once_with(
+            Bucket='results', Key='rendered/ab/abcdef')
+        self.assertEqual(result['body'], 'image')
+        self.assertEqual(result['etag'], '"abc"')
+
+if __name__ == '__main__':
+    unittest.main()
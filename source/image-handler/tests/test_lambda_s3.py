@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import threading
+import time
+import unittest
+from botocore.exceptions import ClientError
+from mock import Mock
+from thumbor.config import Config
+from image_handler import lambda_s3
+
+
+def response(body):
+    return {'Body': Mock(read=Mock(return_value=body)), 'ETag': '"abc"'}
+
+
+class get_object_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config(TC_AWS_MAX_RETRY=2, S3_RETRY_BACKOFF_MS=1)
+        lambda_s3.latencies.clear()
+        for name in lambda_s3.counters:
+            lambda_s3.counters[name] = 0
+
+    def test_reads_body(self):
+        client = Mock()
+        client.get_object.return_value = response('image')
+        result = lambda_s3.get_object(client, self.config, 'bucket', 'key')
+        client.get_object.assert_called_once_with(Bucket='bucket', Key='key')
+        self.assertEqual(result['Body'], 'image')
+        self.assertEqual(lambda_s3.stats()['S3']['Gets'], 1)
+
+    def test_retries_transient_errors(self):
+        client = Mock()
+        client.get_object.side_effect = [IOError('reset'), response('image')]
+        result = lambda_s3.get_object(client, self.config, 'bucket', 'key')
+        self.assertEqual(result['Body'], 'image')
+        self.assertEqual(lambda_s3.counters['Retries'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        client = Mock()
+        client.get_object.side_effect = ClientError(
+            {'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        with self.assertRaises(ClientError):
+            lambda_s3.get_object(client, self.config, 'bucket', 'key')
+        self.assertEqual(client.get_object.call_count, 1)
+
+    def test_slow_get_is_hedged(self):
+        self.config.S3_HEDGE_ENABLED = True
+        self.config.S3_HEDGE_MIN_DELAY_MS = 10
+        lambda_s3.latencies.extend([0.001] * 20)
+        calls = []
+        release = threading.Event()
+
+        def get_object(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                release.wait(5)
+                return response('slow')
+            return response('fast')
+
+        client = Mock(get_object=get_object)
+        start = time.time()
+        result = lambda_s3.get_object(client, self.config, 'bucket', 'key')
+        release.set()
+        self.assertEqual(result['Body'], 'fast')
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(lambda_s3.counters['Hedges'], 1)
+        self.assertEqual(lambda_s3.counters['HedgeWins'], 1)
+
+
+class create_client_test_case(unittest.TestCase):
+
+    def test_pool_size(self):
+        config = Config(TC_AWS_REGION='us-east-1', TC_AWS_ENDPOINT=None,
+                        S3_MAX_CONNECTIONS=32, S3_READ_TIMEOUT=3)
+        client = lambda_s3.create_client(config)
+        adapter = client._endpoint.http_session.get_adapter(
+            'https://s3.amazonaws.com')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(client._endpoint.timeout[1], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+
+import base64
+import socket
+import threading
+import unittest
+import urllib2
+from mock import patch
+from image_handler import lambda_server
+
+
+class build_event_test_case(unittest.TestCase):
+
+    def test_event_shape(self):
+        event = lambda_server.build_event(
+            'HEAD', '/fit-in/100x100/image.jpg?v=1&v=2', {'Accept': '*/*'})
+        self.assertEqual(event['path'], '/fit-in/100x100/image.jpg')
+        self.assertEqual(event['requestContext']['httpMethod'], 'HEAD')
+        self.assertEqual(event['queryStringParameters'], {'v': '2'})
+        self.assertEqual(event['headers'], {'Accept': '*/*'})
+
+
+class server_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.server = lambda_server.make_server(0)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_response_is_decoded(self):
+        response = {
+            'statusCode': '200',
+            'headers': {'Content-Type': 'image/png', 'Etag': '"abc"'},
+            'body': base64.b64encode('image'),
+            'isBase64Encoded': 'true'
+        }
+        with patch('image_handler.lambda_function.lambda_handler',
+                   return_value=response) as handler:
+            request = urllib2.Request(
+                'http://127.0.0.1:%d/image.png' % self.port,
+                headers={'Accept': 'image/webp'})
+            result = urllib2.urlopen(request)
+        event, context = handler.call_args[0]
+        self.assertEqual(event['path'], '/image.png')
+        self.assertEqual(event['headers']['Accept'], 'image/webp')
+        self.assertGreater(context.get_remaining_time_in_millis(), 0)
+        self.assertEqual(result.read(), 'image')
+        self.assertEqual(result.info()['Content-Length'], '5')
+        self.assertEqual(result.info()['Etag'], '"abc"')
+
+    def test_error_status(self):
+        response = {'statusCode': 404, 'headers': {}, 'body': '{}'}
+        with patch('image_handler.lambda_function.lambda_handler',
+                   return_value=response):
+            with self.assertRaises(urllib2.HTTPError) as error:
+                urllib2.urlopen('http://127.0.0.1:%d/missing.png' % self.port)
+        self.assertEqual(error.exception.code, 404)
+
+    def request(self, raw):
+        client = socket.create_connection(('127.0.0.1', self.port),
+                                          timeout=5)
+        client.sendall(raw)
+        return client
+
+    def read_all(self, client):
+        data = ''
+        try:
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    return data
+                data += chunk
+        finally:
+            client.close()
+
+    def test_concurrent_clients(self):
+        response = {'statusCode': 200, 'headers': {}, 'body': 'ok'}
+        with patch('image_handler.lambda_function.lambda_handler',
+                   return_value=response):
+            first = self.request('GET /a.png HTTP/1.1\r\nHost: x\r\n'
+                                 'Connection: keep-alive\r\n\r\n')
+            second = self.request('GET /b.png HTTP/1.1\r\nHost: x\r\n'
+                                  'Connection: keep-alive\r\n\r\n')
+            try:
+                # both complete without the first client hanging up
+                second_reply = self.read_all(second)
+                first_reply = self.read_all(first)
+            finally:
+                first.close()
+                second.close()
+        for reply in (first_reply, second_reply):
+            self.assertTrue(reply.startswith('HTTP/1.1 200'))
+            self.assertIn('Connection: close', reply)
+            self.assertTrue(reply.endswith('\r\n\r\nok'))
+
+    def test_request_body_is_not_read_as_a_request(self):
+        response = {'statusCode': 405, 'headers': {}, 'body': ''}
+        with patch('image_handler.lambda_function.lambda_handler',
+                   return_value=response) as handler:
+            client = self.request('POST /a.png HTTP/1.1\r\nHost: x\r\n'
+                                  'Content-Length: 18\r\n\r\n'
+                                  'GET /b.png HTTP/1.0')
+            reply = self.read_all(client)
+        self.assertEqual(reply.count('HTTP/1.1 405'), 1)
+        self.assertEqual(handler.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
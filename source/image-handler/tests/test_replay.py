@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+##############################################################################
+#  Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.   #
+#                                                                            #
+#  Licensed under the Amazon Software License (the "License"). You may not   #
+#  use this file except in compliance with the License. A copy of the        #
+#  License is located at                                                     #
+#                                                                            #
+#      http://aws.amazon.com/asl/                                            #
+#                                                                            #
+#  or in the "license" file accompanying this file. This file is distributed #
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,        #
+#  express or implied. See the License for the specific language governing   #
+#  permissions and limitations under the License.                            #
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from botocore.exceptions import ClientError
+from image_handler import lambda_s3
+from test.test_support import EnvironmentVarGuard
+import replay
+
+
+class parse_log_test_case(unittest.TestCase):
+
+    def test_cloudfront(self):
+        lines = [
+            '#Version: 1.0\n',
+            '#Fields: date time x-edge-location cs-method cs-uri-stem '
+            'sc-status cs-uri-query\n',
+            '2026-10-19\t12:00:01\tIAD\tGET\t/fit-in/100x100/a.jpg\t200\t-\n',
+            '2026-10-19\t12:00:02\tIAD\tPOST\t/a.jpg\t405\t-\n',
+            '2026-10-19\t12:00:03\tIAD\tHEAD\t/a.jpg\t200\tv=2\n'
+        ]
+        requests = list(replay.parse_log(lines))
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0][1:3], ('GET', '/fit-in/100x100/a.jpg'))
+        self.assertEqual(requests[1][1:3], ('HEAD', '/a.jpg?v=2'))
+        self.assertEqual(requests[1][0] - requests[0][0], 2)
+
+    def test_api_gateway(self):
+        lines = [
+            '{"httpMethod": "GET", "path": "/a.jpg", '
+            '"requestTime": "19/Oct/2026:14:00:00 +0200"}\n',
+            '{"httpMethod": "GET", "path": "/b.jpg", '
+            '"requestTimeEpoch": 1792411200500}\n'
+        ]
+        first, second = replay.parse_log(lines)
+        self.assertEqual(first[0], 1792411200)
+        self.assertEqual(second[0], 1792411200.5)
+        self.assertEqual(second[3], {'Accept': 'image/webp,*/*'})
+
+
+class stand_in_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'bucket'))
+        with open(os.path.join(self.root, 'bucket', 'a.jpg'), 'wb') as f:
+            f.write('image')
+        self.stand_in = replay.S3StandIn(self.root)
+        self.stand_in.start()
+        self.env = EnvironmentVarGuard()
+        self.env.set('AWS_ACCESS_KEY_ID', 'replay')
+        self.env.set('AWS_SECRET_ACCESS_KEY', 'replay')
+        self.config = {'TC_AWS_ENDPOINT': self.stand_in.endpoint,
+                       'TC_AWS_REGION': 'us-east-1'}
+
+    def tearDown(self):
+        self.stand_in.stop()
+        shutil.rmtree(self.root)
+
+    def test_get_put_and_missing(self):
+        with self.env:
+            # two clients take turns, as concurrent replay workers do
+            client = lambda_s3.create_client(self.config)
+            other = lambda_s3.create_client(self.config)
+            response = lambda_s3.get_object(
+                client, self.config, 'bucket', 'a.jpg')
+            other.put_object(Bucket='bucket', Key='out/b.png', Body='png')
+            written = lambda_s3.get_object(
+                client, self.config, 'bucket', 'out/b.png')
+            with self.assertRaises(ClientError):
+                other.get_object(Bucket='bucket', Key='missing.jpg')
+        self.assertEqual(response['Body'], 'image')
+        self.assertTrue(response['ETag'])
+        self.assertEqual(written['Body'], 'png')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, 'bucket', 'out')))
+
+
+class summarize_test_case(unittest.TestCase):
+
+    def test_report(self):
+        outcomes = [
+            {'Status': 200, 'Seconds': 0.5, 'Queued': 0, 'Source': 'Handler',
+             'PeakRss': 200 * 1024 * 1024, 'Degraded': None},
+            {'Status': 200, 'Seconds': 0.01, 'Queued': 0.1,
+             'Source': 'Memory', 'PeakRss': 100 * 1024 * 1024,
+             'Degraded': 'quality'}
+        ]
+        workers = [{
+            'Cache': {'ResultCache': {'Memory': {'Hits': 1, 'Misses': 1}}},
+            'S3': {'Gets': 1, 'P50Ms': 20, 'P99Ms': 30},
+            'Rss': 150 * 1024 * 1024
+        }]
+        report = replay.summarize(outcomes, workers, 1.0)
+        self.assertEqual(report['Source'], {'Handler': 1, 'Memory': 1})
+        self.assertEqual(report['Degraded'], 1)
+        self.assertEqual(report['LatencyMs']['P100'], 500)
+        self.assertEqual(report['PeakRssMb']['P100'], 200)
+        self.assertEqual(report['ResultCache']['Memory']['HitRate'], 0.5)
+        self.assertEqual(report['S3'], {'Gets': 1, 'P99Ms': 30})
+
+if __name__ == '__main__':
+    unittest.main()